@@ -3,4 +3,4 @@
 __version__ = "0.0.5"
 
 from .decorators import *
-from .data import Batch
+from .data import Batch, MappedData, Stream
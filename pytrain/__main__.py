@@ -1,15 +1,62 @@
 #!/usr/bin/env python3
 # PyTrain — Copyright (c) 2019, Alex J. Champandard.
 """
-Usage: pytrain [-i FILTER] [-p ROOTDIR] [-d DEVICE] [-r RESUME]
+Usage: pytrain bench [-i FILTER] [-d DEVICE] [--size S] [--repeat N] [--output FILE]
+               [--compare FILE] [--tolerance T]
+       pytrain sweep [-i FILTER] [-p ROOTDIR] [-d DEVICE] [-j JOBS] [--search S]
+               [--trials N] [--epochs N] [--eta N] (--set SPEC)...
+       pytrain serve [-i FILTER] [-p ROOTDIR] [--shm DIR]
+       pytrain [-i FILTER] [-p ROOTDIR] [-d DEVICE] [-r RESUME] [-w WORKERS] [--precision P]
+               [--checkpoint N] [--keep N] [--cache] [--cache-limit GB]
+               [--profile] [--trace STEPS] [--headless] [--log FILE] [--log-interval S]
+               [-j JOBS] [--threads N] [--compile] [--async-eval] [--shared-optimizer]
+               [--memory-budget GB] [--report-interval N] [--attach] [--shm DIR]
 
 Options:
   -i FILTER --include FILTER  Select tests to run by matching this substring filter.
   -p PATH --path PATH         Root directory from which to collect all the tasks.
-  -r --resume                 Whether to reload previously trained components first. [default: False]
+  -r --resume                 Whether to reload components and training state first. [default: False]
   -d DEVICE --device DEVICE   Device to use for optimizing the components. [default: cpu]
+  -w N --workers N            Number of local processes for data-parallel training. [default: 1]
+  --precision P               Floating-point precision of training, fp32 bf16 or fp16. [default: fp32]
+  --checkpoint N              Interval in epochs between checkpoints, or zero to disable. [default: 1]
+  --keep N                    Number of most recent checkpoints to keep per group. [default: 3]
+  --cache                     Cache the tensors of constructed datasets on disk. [default: False]
+  --cache-limit GB            Maximum size of the dataset cache in gigabytes. [default: 16]
+  --profile                   Report timings per task, throughput and peak memory. [default: False]
+  --trace STEPS               Export a Chrome trace for a range of steps, e.g. 10:20.
+  --headless                  Log progress as JSON lines instead of the interface. [default: False]
+  --log FILE                  File for the headless progress log, or - for stdout. [default: -]
+  --log-interval S            Minimum number of seconds between headless logs. [default: 10]
+  -j N --jobs N               Number of component groups to train concurrently. [default: 1]
+  --threads N                 Number of intra-op threads for each group being trained.
+  --compile                   Compile all tasks with torch.compile and cache the code. [default: False]
+  --async-eval                Validate snapshots of components while training continues. [default: False]
+  --shared-optimizer          Optimize all groups of a stage with one optimizer. [default: False]
+  --memory-budget GB          Maximum memory of activations per task in gigabytes.
+  --report-interval N         Number of steps between reading back losses from devices. [default: 10]
+  --attach                    Attach to datasets in shared memory from `pytrain serve`. [default: False]
+  --shm DIR                   Directory in shared memory for served datasets. [default: /dev/shm/pytrain]
+
+Benchmarks:
+  --size S                    Comma-separated sizes, from small medium or large. [default: small]
+  --repeat N                  Number of timed repetitions of each benchmark. [default: 5]
+  --output FILE               File to store the benchmark results as JSON. [default: pytrain-bench.json]
+  --compare FILE              Previous results to compare against, failing on regressions.
+  --tolerance T               Relative slowdown tolerated before a regression. [default: 0.1]
+
+Sweeps:
+  --search S                  Strategy of the sweep, grid random or halving. [default: grid]
+  --trials N                  Number of trials sampled from ranges of values. [default: 9]
+  --epochs N                  Epochs per trial, or in the first round of halving. [default: 1]
+  --eta N                     Factor by which each round of halving reduces trials. [default: 3]
+  --set SPEC                  Values of a setting, e.g. learning_rate=1e-3,1e-2 or 1e-4:1e-1.
 """
 
+import os
+import sys
+import random
+import socket
 import asyncio
 
 from docopt import docopt
@@ -19,8 +66,13 @@ from .application import Application
 from .registry import Registry
 
 
-def main():
-    config = docopt(__doc__, version=f"pytrain {__version__}")
+def run(config):
+    jobs = int(config.get("--jobs") or 1)
+    if config.get("--threads") or jobs > 1:
+        import torch
+
+        threads = max(1, torch.get_num_threads() // jobs)
+        torch.set_num_threads(int(config.get("--threads") or threads))
 
     registry = Registry(config)
     registry.load()
@@ -30,5 +82,60 @@ def main():
     application.run()
 
 
+def run_worker(rank, workers, port, seed, config):
+    import torch
+    import torch.distributed as dist
+
+    # Datasets and components are constructed identically by all the workers.
+    torch.manual_seed(seed)
+    torch.set_num_threads(max(1, os.cpu_count() // workers))
+    if rank > 0:
+        sys.stdout = open(os.devnull, "w")
+
+    dist.init_process_group(
+        "gloo", init_method=f"tcp://127.0.0.1:{port}", rank=rank, world_size=workers
+    )
+    try:
+        run(config)
+    finally:
+        dist.destroy_process_group()
+
+
+def main():
+    config = docopt(__doc__, version=f"pytrain {__version__}")
+    if config["bench"]:
+        from .bench import main as bench
+
+        return bench(config)
+    if config["sweep"]:
+        from .sweep import main as sweep
+
+        return sweep(config)
+    if config["serve"]:
+        from .serve import main as serve
+
+        return serve(config)
+
+    if config.get("--trace") is not None:
+        from .profiling import parse_trace
+
+        parse_trace(config["--trace"])
+
+    workers = int(config["--workers"])
+    if workers <= 1:
+        return run(config)
+
+    import torch.multiprocessing
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    seed = random.randrange(2 ** 31)
+    torch.multiprocessing.spawn(
+        run_worker, args=(workers, port, seed, config), nprocs=workers
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -2,10 +2,13 @@
 
 import os
 import sys
+import copy
 import math
 import time
 import asyncio
 import itertools
+import contextlib
+import concurrent.futures
 
 from prompt_toolkit import HTML, print_formatted_text
 from prompt_toolkit.styles import Style
@@ -16,8 +19,12 @@ from prompt_toolkit.shortcuts.progress_bar import formatters
 from prompt_toolkit.utils import _CHAR_SIZES_CACHE
 
 from . import __version__
-from .trainer import BasicTrainer
+from .trainer import BasicTrainer, accumulate, summarize
 from .registry import Function
+from .checkpoint import Checkpointer, digest
+from .profiling import Profiler
+from .headless import HeadlessBar
+from .termination import Termination
 
 
 class ShowBar(formatters.Formatter):
@@ -77,39 +84,60 @@ SCREEN_FORMATTERS = [
 
 
 class Application:
-    def __init__(self, loop, device, registry):
+    def __init__(self, loop, device, registry, datasets=None, save=True):
         self.loop = loop
         self.device = device
         self.registry = registry
         self.losses = {}
+        self.results = {}
+        self.save = save
 
         self._components = self.registry.create_components(self.device)
-        self._datasets = self.registry.create_datasets()
+        self._datasets = self.registry.create_datasets(shared=datasets)
         self._tasks = []
+        self.headless = bool(self.registry.config.get("--headless"))
+        self.stdout = None
         self.quit = False
+        self.checkpoints = Checkpointer(
+            keep=int(self.registry.config.get("--keep") or 3)
+        )
+        self.stopping = False
 
-    def prepare_function(self, function, mode="training"):
+    def prepare_function(
+        self, function, mode="training", trainer=None, components=None
+    ):
+        trainer = trainer or self.trainer
+        components = components or self._components
         args, length = {}, None
         for param in function.signature.parameters.values():
             type_ = param.annotation
-            if type_ in self._components:
-                args[param.name] = self._components[type_]
+            if type_ in components:
+                args[param.name] = components[type_]
             if type_ in self._datasets:
                 assert length is None, "Only one dataset per function supported."
                 data = getattr(self._datasets[type_], mode)
                 if data is None:
                     length = -1
-                else:
-                    length = math.ceil(len(data) / function.config("batch_size", 32))
+                elif hasattr(data, "__len__"):
+                    batch_size = function.config("batch_size", 32) * trainer.world
+                    length = math.ceil(len(data) / batch_size)
                     length = function.config("iteration", length)
+                else:
+                    length = function.config("iteration", None)
+                    if length is None:
+                        raise ValueError(
+                            f"Streaming data for {function.name} requires "
+                            + "@terminates(iteration=...)."
+                        )
 
                 args[param.name] = data
         assert length is not None, f"No dataset found for functtion {function.name}."
         return args, length
 
-    async def run_function(self, function, args, iterations, mode):
-        context = self.trainer.setup_function(function, args, mode)
-        run_one_batch = getattr(self.trainer, "run_" + mode)
+    async def run_function(self, function, args, iterations, mode, trainer=None):
+        trainer = trainer or self.trainer
+        context = trainer.setup_function(function, args, mode)
+        run_one_batch = getattr(trainer, "run_" + mode)
 
         progress = self.progress_bar(
             data=range(iterations), label="  - " + function.name, remove_when_done=True
@@ -119,9 +147,9 @@ class Application:
         try:
             for i in progress:
                 loss = run_one_batch(context)
-                yield progress, loss
-                if loss == "break":
+                if isinstance(loss, str) and loss == "break":
                     break
+                yield progress, loss
         finally:
             if progress in progress.progress_bar.counters:
                 progress.done = True
@@ -134,12 +162,21 @@ class Application:
             epochs = max(epochs, config.get("epoch", 0))
         return epochs
 
-    async def run_all_functions(self, epoch, functions, mode="training"):
+    async def run_all_functions(
+        self,
+        epoch,
+        functions,
+        mode="training",
+        trainer=None,
+        termination=None,
+        components=None,
+    ):
+        trainer = trainer or self.trainer
         functions = [f for f in functions if "task_" in f.name]
 
         args, length = [], 0
         for function in functions:
-            a, l = self.prepare_function(function, mode)
+            a, l = self.prepare_function(function, mode, trainer, components)
             args.append(a)
             length = max(l, length)
 
@@ -147,44 +184,70 @@ class Application:
             return
 
         children = [
-            self.run_function(f, a, length, mode=mode) for f, a in zip(functions, args)
+            (i, self.run_function(f, a, length, mode=mode, trainer=trainer))
+            for i, (f, a) in enumerate(zip(functions, args))
         ]
-        total = [0.0 for _ in children]
+        # Losses are accumulated on the device and only read back periodically.
+        interval = int(self.registry.config.get("--report-interval") or 10)
+        total = [None for _ in children]
+        progress = [None for _ in children]
+        average, metrics = None, {}
         for j in self.progress_bar(range(length), label=mode, remove_when_done=True):
-            for i, task in enumerate(list(children)):
+            for i, task in list(children):
                 try:
-                    progress, loss = await task.__anext__()
-                    total[i] += loss
+                    progress[i], loss = await task.__anext__()
+                    total[i] = accumulate(total[i], loss)
                 except StopAsyncIteration:
-                    children.remove(task)
+                    children.remove((i, task))
 
-                self.losses[id(progress)] = total[i] / (j + 1)
+            stop = len(children) == 0 or self.quit is True
+            timed = termination is not None and termination.seconds is not None
+            if not stop and timed:
+                stop = trainer.synchronize(termination.expired())
 
-            yield j, sum(total) / (j + 1)
+            if stop or (j + 1) % interval == 0 or j + 1 == length:
+                average, metrics = self.read_back(progress, total, j + 1)
+            yield j, average
 
-            if len(children) == 0:
-                break
-            if self.quit is True:
+            if stop:
                 break
 
         if len(children) != 0:
-            for task in children:
+            for _, task in children:
                 await task.aclose()
 
-        print(
-            f"📉  {mode.capitalize()} loss for epoch #{epoch} is {sum(total) / (j + 1)}."
-        )
-
-    async def run_all_tests(self, epoch, functions):
+        details = "".join(f", {k}={v:1.4e}" for k, v in sorted(metrics.items()))
+        print(f"📉  {mode.capitalize()} loss for epoch #{epoch} is {average}{details}.")
+
+    def read_back(self, progress, total, steps):
+        """Reduce the losses accumulated on the device to averages per step, updating
+        the display of each function, and return their sum with any other metrics.
+        """
+        average, metrics = 0.0, {}
+        for p, t in zip(progress, total):
+            if t is None:
+                continue
+            loss = summarize(t, steps)
+            if isinstance(loss, dict):
+                metrics.update({k: v for k, v in loss.items() if k != "loss"})
+                loss = loss.get("loss", math.nan)
+            if id(p) in self.losses:
+                self.losses[id(p)] = loss
+            average += loss
+        return average, metrics
+
+    async def run_all_tests(self, epoch, functions, trainer=None, components=None):
         functions = [f for f in functions if "show_" in f.name]
         args, iters = [], {}
         for function in functions:
-            a, i = self.prepare_function(function, mode="training")
+            a, i = self.prepare_function(function, "training", trainer, components)
             args.append(a)
             iters[function] = i
 
         children = [
-            self.run_function(f, a, iterations=iters[f], mode="validation")
+            self.run_function(
+                f, a, iterations=iters[f], mode="validation", trainer=trainer
+            )
             for f, a in zip(functions, args)
         ]
         while len(children) > 0:
@@ -195,7 +258,8 @@ class Application:
                 except StopAsyncIteration:
                     children.remove(task)
 
-    async def run_components(self, components, functions, epochs):
+    async def run_components(self, components, functions, epochs, trainer=None):
+        trainer = trainer or self.trainer
         start = time.time()
 
         label, instances = [], []
@@ -204,41 +268,158 @@ class Application:
             instances.append(cp)
             label.append(cp.__class__.__module__ + "." + cp.__class__.__name__)
 
-        self.trainer.setup_components(instances)
+        name = digest(" ".join(label))
+        steps, batch_size = self.plan(functions, epochs, trainer)
+        optimizer = trainer.setup_components(instances, steps, batch_size)
+
+        first = 0
+        if self.registry.config.get("--resume"):
+            state = self.checkpoints.load(name)
+            if state is not None:
+                for key, instance in zip(label, instances):
+                    instance.load_state_dict(state["components"][key])
+                trainer.load_state_dict(optimizer, state["trainer"])
+                first = state["epoch"] + 1
+
+        termination = Termination.from_config(
+            instances + [f.function for f in functions]
+        )
+        interval = int(self.registry.config.get("--checkpoint") or 0)
+
+        # Runs resumed from their last epoch have no results, but still finish.
+        training, validation = None, None
+        evaluation, pending = None, None
+        # Collectives of another thread would interleave with training across workers.
+        if self.registry.config.get("--async-eval") and trainer.world == 1:
+            evaluation = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            evaluator = trainer.fork()
+
         for i in self.progress_bar(
-            range(epochs), label=" ".join(label), remove_when_done=True
+            range(first, epochs), label=" ".join(label), remove_when_done=True
         ):
-            loss = 0.0
-
-            async for j, loss in self.run_all_functions(i, functions, mode="training"):
-                yield j
+            training, validation = None, None
 
-            async for j, loss in self.run_all_functions(
-                i, functions, mode="validation"
+            options = dict(trainer=trainer, termination=termination)
+            async for j, training in self.run_all_functions(
+                i, functions, mode="training", **options
             ):
                 yield j
 
-            async for j in self.run_all_tests(i, functions):
-                yield j
-
-            self.trainer.report(loss)
-
+            # Components are evaluated with their averaged weights, if any.
+            trainer.average_epoch(instances)
+            if evaluation is not None:
+                # Results of the previous epoch's evaluation, which ran meanwhile.
+                if pending is not None:
+                    validation = await asyncio.wrap_future(pending)
+
+                snapshot = dict(self._components)
+                with trainer.swap_averages(instances):
+                    snapshot.update(
+                        {cp: copy.deepcopy(snapshot[cp]) for cp in components}
+                    )
+                pending = evaluation.submit(
+                    self._evaluate, i, functions, evaluator, snapshot
+                )
+            else:
+                with trainer.swap_averages(instances):
+                    async for j, validation in self.run_all_functions(
+                        i, functions, mode="validation", **options
+                    ):
+                        yield j
+
+                    async for j in self.run_all_tests(i, functions, trainer=trainer):
+                        yield j
+
+            trainer.report(validation if validation is not None else training)
+            converged = trainer.synchronize(termination.update(training, validation))
+
+            if interval > 0 and (i + 1) % interval == 0 and trainer.rank == 0:
+                state = {
+                    "components": {
+                        key: instance.state_dict()
+                        for key, instance in zip(label, instances)
+                    },
+                    "trainer": trainer.state_dict(optimizer),
+                }
+                self.checkpoints.save(name, i, state)
+
+            if converged:
+                reason = termination.reason or "another worker converged"
+                print(f"{' '.join(label)}\n🛑  Stopping early, {reason}.")
+                break
             if self.quit is True:
                 break
 
+        if evaluation is not None:
+            # Results of the last epoch's evaluation are those of the final weights.
+            if pending is not None:
+                validation = await asyncio.wrap_future(pending)
+            evaluation.shutdown()
+
         elapsed = time.time() - start
         print(
             f"{' '.join(label)}\n"
             + f"🏁  Training completed in {elapsed:1.1f}s total time."
         )
 
-        self.trainer.save([self._components[cp] for cp in components])
+        self.results[name] = validation if validation is not None else training
+        if self.save:
+            trainer.save(
+                [self._components[cp] for cp in components],
+                write=self.checkpoints.write,
+            )
+        trainer.release(optimizer)
         await asyncio.sleep(0.01)
 
+    def plan(self, functions, epochs, trainer):
+        """Estimate the total number of training steps of a group, and the largest
+        batch size of its tasks, to schedule the learning rates.
+        """
+        length, batch_size = 0, None
+        for function in functions:
+            if "task_" not in function.name:
+                continue
+            _, l = self.prepare_function(function, "training", trainer)
+            length = max(l, length)
+            batch_size = max(function.config("batch_size", 32), batch_size or 0)
+        return (epochs * length if length > 0 else None), batch_size
+
+    def _evaluate(self, epoch, functions, trainer, components):
+        """Run the validation and show functions of a group on a snapshot of its
+        components, from a separate thread while training continues.
+        """
+
+        async def _run():
+            validation = None
+            async for _, validation in self.run_all_functions(
+                epoch, functions, "validation", trainer, components=components
+            ):
+                pass
+            async for _ in self.run_all_tests(epoch, functions, trainer, components):
+                pass
+            return validation
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(_run())
+        finally:
+            loop.close()
+
     def stop(self, _):
-        self.quit = True
+        self.stopping = True
+
+    def create_interface(self, output=None, input=None):
+        config = self.registry.config
+
+        # Other distributed workers stay silent, like headless runs without a log.
+        if self.headless or self.trainer.rank > 0:
+            stream = None
+            if self.trainer.rank == 0:
+                log = config.get("--log") or "-"
+                stream = (self.stdout or sys.stdout) if log == "-" else open(log, "a")
+            interval = float(config.get("--log-interval") or 10.0)
+            return HeadlessBar(self.losses, stream=stream, interval=interval)
 
-    async def main(self):
         bindings = KeyBindings()
         bindings.add("c-x")(self.stop)
         bindings.add("c-c")(self.stop)
@@ -250,27 +431,53 @@ class Application:
 
         project = os.path.basename(os.getcwd())
         print_formatted_text(
-            SCREEN_BANNER.format(__version__, project), style=SCREEN_STYLE, flush=True
+            SCREEN_BANNER.format(__version__, project),
+            style=SCREEN_STYLE,
+            output=output,
+            flush=True,
         )
 
-        self.progress_bar = ProgressBar(
+        return ProgressBar(
             bottom_toolbar=SCREEN_TOOLBAR,
             style=SCREEN_STYLE,
             key_bindings=bindings,
             formatters=formatters,
+            output=output,
+            input=input,
         )
 
-        self.trainer = BasicTrainer(device=self.device)
+    async def main(self):
+        self.profiler = Profiler(
+            self.device,
+            enabled=bool(self.registry.config.get("--profile")),
+            trace=self.registry.config.get("--trace"),
+        )
+        budget = self.registry.config.get("--memory-budget")
+        if budget is not None:
+            budget = float(budget) * 2 ** 30
+
+        self.trainer = BasicTrainer(
+            device=self.device,
+            precision=self.registry.config.get("--precision") or "fp32",
+            profiler=self.profiler,
+            compile=bool(self.registry.config.get("--compile")),
+            shared=bool(self.registry.config.get("--shared-optimizer")),
+            budget=budget,
+        )
+        self.progress_bar = self.create_interface()
 
         scripts = [f for f in self.registry.functions if "main_" in f.name]
 
-        # Old-style hard-coded training procedure.
-        if len(scripts) == 0:
-            await self._run_stage(stage="N/A", groups=self.registry.groups())
+        try:
+            # Old-style hard-coded training procedure.
+            if len(scripts) == 0:
+                await self._run_stage(stage="N/A", groups=self.registry.groups())
 
-        # New-style user-defined training scripts.
-        if len(scripts) == 1:
-            await scripts[0].function(self)
+            # New-style user-defined training scripts.
+            if len(scripts) == 1:
+                await scripts[0].function(self)
+        finally:
+            self.profiler.report()
 
     async def fit(self, stage, epochs, group):
         self.trainer.learning_rate = group["learning_rate"]
@@ -297,22 +504,79 @@ class Application:
         with self.progress_bar:
             self.progress_bar.title = HTML(f"<b>Stage {stage}</b>: {description}")
 
+            jobs = int(self.registry.config.get("--jobs") or 1)
+            # Groups sharing components would update the same parameters on threads.
+            owned = [set(components) for components, _ in groups]
+            if jobs > 1 and sum(map(len, owned)) != len(set().union(*owned)):
+                print("WARNING: Groups share components, not training concurrently.")
+                jobs = 1
+            if jobs > 1 and self.trainer.world == 1:
+                return await self._run_concurrent(groups, epochs, jobs)
+
             for components, functions in groups:
                 epoch = self.prepare_components(components, epochs=epochs)
                 root = self.run_components(components, functions, epoch)
                 self._tasks.append(root)
 
             while len(self._tasks) > 0:
-                self.trainer.prepare()
-                for root in list(self._tasks):
-                    try:
-                        await root.__anext__()
-                    except StopAsyncIteration:
-                        self._tasks.remove(root)
+                # Time of whole ticks also includes the scheduling and interface.
+                with self.profiler.measure("application", "tick"):
+                    await self._run_tick()
+
+    async def _run_concurrent(self, groups, epochs, jobs):
+        """Train independent groups of components on separate threads, each with its
+        own trainer, since PyTorch releases the interpreter lock during operations.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                self.loop.run_in_executor(
+                    pool, self._run_group, components, functions, epochs
+                )
+                for components, functions in groups
+            ]
+            await asyncio.gather(*futures)
+
+    def _run_group(self, components, functions, epochs):
+        trainer = self.trainer.fork()
+        epoch = self.prepare_components(components, epochs=epochs)
+        root = self.run_components(components, functions, epoch, trainer=trainer)
+
+        async def _drive():
+            while True:
+                self.quit = self.stopping
+                trainer.prepare()
+                try:
+                    await root.__anext__()
+                except StopAsyncIteration:
+                    break
+                trainer.step()
 
-                self.trainer.step()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(_drive())
+        finally:
+            loop.close()
+
+    async def _run_tick(self):
+        self.quit = self.trainer.synchronize(self.stopping)
+        self.trainer.prepare()
+        for root in list(self._tasks):
+            try:
+                await root.__anext__()
+            except StopAsyncIteration:
+                self._tasks.remove(root)
+
+        self.trainer.step()
 
     def run(self):
+        # Headless logs on stdout stay valid JSON lines, with messages on stderr.
+        self.stdout = sys.stdout
+        if self.headless:
+            with contextlib.redirect_stdout(sys.stderr):
+                return self._run_main()
+        return self._run_main()
+
+    def _run_main(self):
         if len(self.registry.functions) == 0:
             print(f"ERROR: No tasks found in specified directory.")
             return
@@ -320,7 +584,12 @@ class Application:
         os.makedirs("models", exist_ok=True)
 
         async def _run():
+            if self.headless:
+                return await self.main()
             with patch_stdout():
                 await self.main()
 
-        self.loop.run_until_complete(_run())
+        try:
+            self.loop.run_until_complete(_run())
+        finally:
+            self.checkpoints.wait()
@@ -0,0 +1,328 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import os
+import json
+import math
+import time
+import types
+import asyncio
+import itertools
+import tempfile
+import contextlib
+import statistics
+import subprocess
+
+import torch
+
+from . import __version__
+from .data import Batch
+from .samplers import SAMPLERS
+from .decorators import iterates, terminates
+from .registry import Registry
+
+
+SIZES = {
+    "small": dict(items=1024, features=16, files=8),
+    "medium": dict(items=16384, features=256, files=64),
+    "large": dict(items=131072, features=1024, files=256),
+}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def wrapper(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return wrapper
+
+
+def measure(function, items=1, repeat=5, device="cpu"):
+    """Time calls to a function after a first call to warm up, returning the median
+    duration and the number of items processed per second.
+    """
+    cuda = torch.device(device).type == "cuda"
+    function()
+
+    timings = []
+    for _ in range(repeat):
+        if cuda:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        function()
+        if cuda:
+            torch.cuda.synchronize()
+        timings.append(time.perf_counter() - start)
+
+    seconds = statistics.median(timings)
+    return {"seconds": seconds, "items/s": items / seconds if seconds > 0 else None}
+
+
+class Synthetic:
+    """Random dataset with the extra columns required by all the samplers.
+    """
+
+    def __init__(self, items, features):
+        self.data = torch.randn(items, features)
+        self.labels = torch.randint(0, 10, (items,))
+        self.weights = torch.rand(items)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def create_registry(items, features, config=None):
+    """Build a registry with one component and one training task, as if they were
+    loaded from a module of the project.
+    """
+
+    class BenchModel(torch.nn.Sequential):
+        def __init__(self):
+            super(BenchModel, self).__init__(
+                torch.nn.Linear(features, features),
+                torch.nn.ReLU(),
+                torch.nn.Linear(features, features),
+            )
+
+    def data_benchmark():
+        return torch.randn(items, features)
+
+    @terminates(iteration=50)
+    @iterates(batch_size=64)
+    def task_benchmark(batch: data_benchmark, model: BenchModel):
+        return torch.nn.functional.mse_loss(model(batch.data), batch.data)
+
+    module = types.ModuleType("benchmark")
+    module.task_benchmark = task_benchmark
+
+    registry = Registry(dict({"--checkpoint": "0"}, **(config or {})))
+    registry.load_module(module)
+    return registry
+
+
+@benchmark("samplers")
+def bench_samplers(size, device, repeat):
+    data = Synthetic(size["items"], 1)
+    batches = math.ceil(len(data) / 64)
+
+    results = {}
+    for order in ("ordered", "shuffled", "random", "weighted", "stratified"):
+        sampler = SAMPLERS[order]
+
+        def _epoch():
+            for _ in itertools.islice(sampler(data, 64), batches):
+                pass
+
+        results[order] = measure(_epoch, len(data), repeat)
+    return results
+
+
+@benchmark("batch")
+def bench_batch(size, device, repeat):
+    data = Synthetic(size["items"], size["features"])
+    batches = math.ceil(len(data) / 64)
+    orders = list(itertools.islice(SAMPLERS["shuffled"](data, 64), batches))
+    batch = Batch.from_data({"data": data.data[:64], "labels": data.labels[:64]})
+
+    def _from_data():
+        for order in orders:
+            Batch.from_data({"data": data.data[order], "labels": data.labels[order]})
+
+    def _to():
+        batch.to(device, non_blocking=True)
+
+    return {
+        "from_data": measure(_from_data, len(data), repeat),
+        "to": measure(_to, len(batch), repeat, device),
+    }
+
+
+@benchmark("trainer")
+def bench_trainer(size, device, repeat):
+    from .trainer import BasicTrainer
+
+    registry = create_registry(size["items"], size["features"])
+    components = registry.create_components(device)
+    datasets = registry.create_datasets()
+    function = registry.functions[0]
+
+    trainer = BasicTrainer(device)
+    optimizer = trainer.setup_components(list(components.values()))
+    args = {"model": list(components.values())[0]}
+    args["batch"] = list(datasets.values())[0].training
+    context = trainer.setup_function(function, args, "training")
+    steps = 50
+
+    def _training():
+        for _ in range(steps):
+            trainer.prepare()
+            trainer.run_training(context)
+
+    def _steps():
+        for _ in range(steps):
+            trainer.prepare()
+            trainer.run_training(context)
+            trainer.step()
+
+    results = {
+        "run_training": measure(_training, steps, repeat, device),
+        "step": measure(_steps, steps, repeat, device),
+    }
+    trainer.release(optimizer)
+    return results
+
+
+@benchmark("application")
+def bench_application(size, device, repeat):
+    from prompt_toolkit.input import create_pipe_input
+    from prompt_toolkit.output import DummyOutput
+
+    from .trainer import BasicTrainer
+    from .profiling import Profiler
+    from .application import Application
+
+    results = {}
+    for interface in ("headless", "interface"):
+        config = {"--headless": interface == "headless"}
+        registry = create_registry(size["items"], size["features"], config)
+        loop = asyncio.new_event_loop()
+        application = Application(loop, device, registry)
+        application.profiler = Profiler(device)
+        application.trainer = BasicTrainer(device, profiler=application.profiler)
+        steps = registry.functions[0].config("iteration", 0)
+
+        def _stage():
+            # Input that's open but never typed into, as dummy inputs end the interface.
+            with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+                with create_pipe_input() as pipe:
+                    application.progress_bar = application.create_interface(
+                        output=DummyOutput(), input=pipe
+                    )
+                    loop.run_until_complete(
+                        application._run_stage("benchmark", registry.groups())
+                    )
+                    application.checkpoints.wait()
+
+        results[interface] = measure(_stage, steps, repeat, device)
+        loop.close()
+    return results
+
+
+@benchmark("registry")
+def bench_registry(size, device, repeat):
+    os.makedirs("tasks", exist_ok=True)
+    for i in range(size["files"]):
+        with open(os.path.join("tasks", f"train_{i:04d}.py"), "w") as f:
+            f.write(
+                f"def task_{i}(data):\n    pass\n\n"
+                + f"def show_{i}(data):\n    pass\n\n"
+                + "def helper():\n    pass\n"
+            )
+
+    config = {"--path": "tasks"}
+    index = os.path.join(".pytrain", "index.json")
+
+    def _cold():
+        if os.path.exists(index):
+            os.remove(index)
+        Registry(config).load()
+
+    def _warm():
+        Registry(config).load()
+
+    return {
+        "cold": measure(_cold, size["files"], repeat),
+        "warm": measure(_warm, size["files"], repeat),
+    }
+
+
+def run(sizes, device="cpu", repeat=5, include=None):
+    """Run all the selected benchmarks at each size, from a temporary directory so
+    models and indices written along the way don't affect the project.
+    """
+    results = {}
+    current = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="pytrain-bench-") as directory:
+        os.chdir(directory)
+        os.makedirs("models", exist_ok=True)
+        try:
+            for size, (name, function) in itertools.product(sizes, BENCHMARKS.items()):
+                if include is not None and include not in name:
+                    continue
+
+                print(f"⏱   Benchmarking {name} with {size} size...")
+                for key, value in function(SIZES[size], device, repeat).items():
+                    results[f"{name}.{key}/{size}"] = value
+        finally:
+            os.chdir(current)
+    return results
+
+
+def revision():
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        )
+        return output.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, tolerance=0.1):
+    """Print the change in duration of every benchmark since the baseline, and
+    return the names of benchmarks that are slower than tolerated.
+    """
+    regressions = []
+    print(f"📊  Comparing with {baseline.get('revision') or 'baseline'}:")
+    for key, result in sorted(results.items()):
+        previous = baseline["results"].get(key)
+        if previous is None:
+            continue
+
+        change = result["seconds"] / previous["seconds"] - 1.0
+        marker = ""
+        if change > tolerance:
+            regressions.append(key)
+            marker = "  ⚠️  regression"
+        print(
+            f"  - {key}  {previous['seconds'] * 1000.0:1.3f}ms → "
+            + f"{result['seconds'] * 1000.0:1.3f}ms ({change:+.1%}){marker}"
+        )
+    return regressions
+
+
+def main(config):
+    sizes = (config.get("--size") or "small").split(",")
+    for size in sizes:
+        if size not in SIZES:
+            raise ValueError(f"Unknown benchmark size `{size}`.")
+
+    output = os.path.abspath(config.get("--output") or "pytrain-bench.json")
+    results = run(
+        sizes,
+        device=config.get("--device") or "cpu",
+        repeat=int(config.get("--repeat") or 5),
+        include=config.get("--include"),
+    )
+
+    record = {
+        "version": __version__,
+        "revision": revision(),
+        "torch": torch.__version__,
+        "device": config.get("--device") or "cpu",
+        "threads": torch.get_num_threads(),
+        "time": time.time(),
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(record, f, indent=2)
+    print(f"💾  Stored {len(results)} benchmark results in {output}.")
+
+    if config.get("--compare"):
+        with open(config["--compare"], "r") as f:
+            baseline = json.load(f)
+        tolerance = float(config.get("--tolerance") or 0.1)
+        if len(compare(baseline, results, tolerance)) > 0:
+            return 1
+    return 0
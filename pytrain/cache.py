@@ -0,0 +1,89 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import os
+import shutil
+import inspect
+
+import torch
+
+from .data import Dataset, MappedData
+from .checkpoint import digest
+
+
+SPLITS = ("training", "validation", "testing")
+
+
+def fingerprint(constructor):
+    """Identify a dataset by the source code of its constructor and its configuration,
+    or return None if the source is not available.
+    """
+    try:
+        source = inspect.getsource(constructor)
+    except (OSError, TypeError):
+        return None
+
+    config = sorted(getattr(constructor, "_pytrain", {}).items())
+    name = constructor.__module__ + "." + constructor.__qualname__
+    return digest("\n".join([name, source, repr(config)]))
+
+
+class DatasetCache:
+    """Stores the tensors of constructed datasets as memory-mapped files, evicting the
+    least recently used entries when the cache grows beyond its size limit.
+    """
+
+    def __init__(self, directory, limit):
+        self.directory = directory
+        self.limit = limit
+
+    def load(self, key):
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+
+        splits = {}
+        for split in SPLITS:
+            filename = os.path.join(path, split + ".pyt")
+            splits[split] = None
+            if os.path.exists(filename):
+                splits[split] = MappedData.open(filename).data
+
+        os.utime(path)
+        return Dataset(**splits)
+
+    def store(self, key, dataset):
+        splits = {s: getattr(dataset, s) for s in SPLITS}
+        if not all(v is None or isinstance(v, torch.Tensor) for v in splits.values()):
+            return False
+
+        path = os.path.join(self.directory, key)
+        temp = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(temp, exist_ok=True)
+        for split, data in splits.items():
+            if data is not None:
+                MappedData.write(os.path.join(temp, split + ".pyt"), data)
+
+        try:
+            os.rename(temp, path)
+        except OSError:
+            # Another process stored the same dataset first.
+            shutil.rmtree(temp, ignore_errors=True)
+
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        for key in os.listdir(self.directory):
+            path = os.path.join(self.directory, key)
+            if key.endswith(".tmp") or not os.path.isdir(path):
+                continue
+            size = sum(e.stat().st_size for e in os.scandir(path))
+            entries.append((os.path.getmtime(path), size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries)[:-1]:
+            if total <= self.limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
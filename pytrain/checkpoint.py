@@ -0,0 +1,78 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import os
+import glob
+import hashlib
+import concurrent.futures
+
+import torch
+
+
+def snapshot(state):
+    """Copy all the tensors in a nested state to the CPU, so training can continue
+    modifying the originals while the copy is written to disk.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {k: snapshot(v) for k, v in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(v) for v in state)
+    return state
+
+
+def digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class Checkpointer:
+    """Writes snapshots of training state from a background thread, atomically
+    replacing files and keeping only the most recent checkpoints of each group.
+    """
+
+    def __init__(self, directory="checkpoints", keep=3):
+        # Pruning with `[:-keep]` would keep every checkpoint instead of none.
+        if keep < 1:
+            raise ValueError(f"Invalid keep `{keep}`, use --checkpoint 0 to disable.")
+        self.directory = directory
+        self.keep = keep
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+
+    def write(self, state, path, prune=None):
+        future = self.pool.submit(self._write, snapshot(state), path, prune)
+
+        done = [f for f in self.pending if f.done()]
+        self.pending = [f for f in self.pending if f not in done] + [future]
+
+        # Errors of previous writes that completed meanwhile are raised here.
+        for f in done:
+            f.result()
+        return future
+
+    def _write(self, state, path, prune):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        torch.save(state, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+        if prune is not None:
+            for filename in self.history(prune)[: -self.keep]:
+                os.remove(filename)
+
+    def history(self, name):
+        return sorted(glob.glob(os.path.join(self.directory, f"{name}-*.pkl")))
+
+    def save(self, name, epoch, state):
+        path = os.path.join(self.directory, f"{name}-{epoch:06d}.pkl")
+        return self.write(dict(state, epoch=epoch), path, prune=name)
+
+    def load(self, name):
+        history = self.history(name)
+        if len(history) == 0:
+            return None
+        return torch.load(history[-1], map_location="cpu")
+
+    def wait(self):
+        for future in self.pending:
+            future.result()
+        self.pending = []
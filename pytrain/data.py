@@ -1,17 +1,24 @@
 # PyTrain — Copyright (c) 2019, Alex J. Champandard.
 
+import json
+import math
+import random
+import struct
+import itertools
+
 import torch
 
 
 class Batch:
-    """Data-class that stores multiple items sampled from a dataset.
+    """Data-class that stores multiple items sampled from a dataset, as a dictionary
+    of fields that are also accessible as attributes.
     """
 
+    __slots__ = ("fields", "number")
+
     def __init__(self, **kwargs):
-        for key, value in kwargs.items():
-            setattr(self, key, value)
-        self.attributes = list(kwargs.keys())
-        self.number = None
+        object.__setattr__(self, "fields", kwargs)
+        object.__setattr__(self, "number", None)
 
     @classmethod
     def from_data(_, data):
@@ -21,15 +28,252 @@ class Batch:
             return Batch(**data)
         return Batch(data=data)
 
-    def to(self, device):
-        for key in self.attributes:
-            try:
-                setattr(self, key, getattr(self, key).to(device))
-            except AttributeError:
-                pass
+    @property
+    def attributes(self):
+        return list(self.fields)
+
+    def __getattr__(self, name):
+        try:
+            return object.__getattribute__(self, "fields")[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        if name in Batch.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            self.fields[name] = value
+
+    def __len__(self):
+        for value in self.fields.values():
+            if isinstance(value, torch.Tensor) and value.dim() > 0:
+                return value.shape[0]
+        return 1
+
+    def split(self, size):
+        """Divide the batch into smaller batches along the first dimension, sharing
+        any attributes that are not per-item tensors.
+        """
+        length, chunks = len(self), {}
+        for key, value in self.fields.items():
+            if isinstance(value, torch.Tensor) and value.dim() > 0:
+                if value.shape[0] == length:
+                    chunks[key] = value.split(size)
+
+        batches = []
+        for i in range(math.ceil(length / size)):
+            b = Batch(
+                **{
+                    key: chunks[key][i] if key in chunks else value
+                    for key, value in self.fields.items()
+                }
+            )
+            b.number = self.number
+            batches.append(b)
+        return batches
+
+    def to(self, device, non_blocking=False, staging=None):
+        fields = {}
+        for key, value in self.fields.items():
+            if isinstance(value, torch.Tensor):
+                if staging is not None and value.device.type == "cpu":
+                    value = staging.transfer(key, value, device)
+                else:
+                    value = value.to(device, non_blocking=non_blocking)
+            elif hasattr(value, "to"):
+                value = value.to(device)
+            fields[key] = value
+        object.__setattr__(self, "fields", fields)
         return self
 
 
+class Staging:
+    """Pinned host buffers that are reused between steps, to copy batches to the
+    accelerator asynchronously without allocating new page-locked memory.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def transfer(self, key, value, device):
+        buffer, event = self.buffers.get(key, (None, None))
+        if buffer is None or buffer.shape != value.shape or buffer.dtype != value.dtype:
+            buffer = torch.empty(value.shape, dtype=value.dtype, pin_memory=True)
+        elif event is not None:
+            # Wait until the previous copy from this buffer has completed.
+            event.synchronize()
+
+        buffer.copy_(value)
+        result = buffer.to(device, non_blocking=True)
+
+        event = torch.cuda.Event()
+        event.record()
+        self.buffers[key] = (buffer, event)
+        return result
+
+
+class MappedData:
+    """Dataset stored on disk as one contiguous array for each attribute of a batch,
+    which are memory-mapped when opened and indexed without loading everything.
+
+    The file starts with a magic string and the length of a JSON header, which
+    describes the type, shape and offset of each array following it.
+    """
+
+    MAGIC = b"PYTRAIN\x00"
+    ALIGN = 64
+
+    def __init__(self, columns):
+        lengths = set(v.shape[0] for v in columns.values())
+        if len(lengths) > 1:
+            raise ValueError("MappedData requires columns of the same length.")
+        self.columns = columns
+
+    @classmethod
+    def write(_, path, data):
+        if isinstance(data, MappedData):
+            columns = data.columns
+        elif isinstance(data, Batch):
+            columns = data.fields
+        elif isinstance(data, dict):
+            columns = data
+        else:
+            columns = {"data": data}
+
+        header, offset, arrays = {}, 0, []
+        for key, value in columns.items():
+            value = value.detach().cpu().contiguous()
+            array = value.reshape(-1).view(torch.uint8).numpy()
+            header[key] = {
+                "dtype": str(value.dtype).split(".")[-1],
+                "shape": list(value.shape),
+                "offset": offset,
+            }
+            arrays.append(array)
+            offset += math.ceil(array.nbytes / MappedData.ALIGN) * MappedData.ALIGN
+
+        encoded = json.dumps(header).encode("utf-8")
+        start = len(MappedData.MAGIC) + 8 + len(encoded)
+        start = math.ceil(start / MappedData.ALIGN) * MappedData.ALIGN
+
+        with open(path, "wb") as f:
+            f.write(MappedData.MAGIC + struct.pack("<Q", start))
+            f.write(encoded)
+            for array, info in zip(arrays, header.values()):
+                f.seek(start + info["offset"])
+                f.write(memoryview(array))
+            f.truncate(start + offset)
+
+    @classmethod
+    def open(_, path):
+        import numpy
+
+        with open(path, "rb") as f:
+            magic, start = f.read(len(MappedData.MAGIC)), f.read(8)
+            if magic != MappedData.MAGIC:
+                raise ValueError(f"File `{path}` is not in PyTrain data format.")
+            start = struct.unpack("<Q", start)[0]
+            header = f.read(start - len(MappedData.MAGIC) - 8)
+            header = json.loads(header.rstrip(b"\x00"))
+
+        # Copy-on-write mapping, so pages are shared until written to.
+        buffer = torch.from_numpy(numpy.memmap(path, dtype=numpy.uint8, mode="c"))
+
+        columns = {}
+        for key, info in header.items():
+            dtype = getattr(torch, info["dtype"])
+            size = torch.Size(info["shape"]).numel() * dtype.itemsize
+            first = start + info["offset"]
+            array = buffer[first : first + size].view(dtype)
+            columns[key] = array.view(info["shape"])
+        return MappedData(columns)
+
+    def __len__(self):
+        return next(iter(self.columns.values())).shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return MappedData({k: v[index] for k, v in self.columns.items()})
+        return Batch(**{k: v[index] for k, v in self.columns.items()})
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns", {})
+        if name not in columns:
+            raise AttributeError(name)
+        return columns[name]
+
+
+class Stream:
+    """Dataset that can only be read sequentially, either from an iterator or from a
+    list of shards that are each opened by a reader function to produce items.
+    Items are shuffled through a buffer of fixed size to bound memory usage.
+    """
+
+    def __init__(self, source=None, shards=None, reader=None, shuffle=0):
+        if (source is None) == (shards is None):
+            raise ValueError("Stream requires either a source or shards.")
+        if shards is not None and reader is None:
+            raise ValueError("Stream with shards requires a reader function.")
+
+        self.source = source
+        self.shards = list(shards) if shards is not None else None
+        self.reader = reader
+        self.shuffle = shuffle
+        self.sharded = None
+        self.buffer = []
+
+    def items(self, rank=0, world=1, generator=None):
+        if self.shards is None:
+            if not hasattr(self.source, "__next__"):
+                return itertools.islice(iter(self.source), rank, None, world)
+
+            # Iterators continue across epochs, so they're only sharded once.
+            if self.sharded is None:
+                self.sharded = itertools.islice(self.source, rank, None, world)
+            return self.sharded
+
+        if len(self.shards) >= world:
+            return self._read(self.shards[rank::world], generator)
+        return itertools.islice(self._read(self.shards, generator), rank, None, world)
+
+    def _read(self, shards, generator):
+        while True:
+            for i in torch.randperm(len(shards), generator=generator).tolist():
+                yield from self.reader(shards[i])
+
+    def shuffled(self, items, generator=None):
+        if self.shuffle <= 1:
+            yield from items
+            return
+
+        # Kept across epochs, so items buffered when an epoch ends aren't lost.
+        seed = torch.randint(0, 2 ** 62, size=(1,), generator=generator)
+        rng, buffer = random.Random(int(seed)), self.buffer
+        for item in items:
+            if len(buffer) < self.shuffle:
+                buffer.append(item)
+                continue
+            i = rng.randrange(len(buffer))
+            item, buffer[i] = buffer[i], item
+            yield item
+
+        rng.shuffle(buffer)
+        while len(buffer) > 0:
+            yield buffer.pop()
+
+
+def collate(items):
+    """Stack individual items from a stream into a single batch.
+    """
+    first = items[0]
+    if isinstance(first, Batch):
+        keys = first.fields
+        return Batch(**{k: torch.stack([i.fields[k] for i in items]) for k in keys})
+    if isinstance(first, dict):
+        return Batch(**{k: torch.stack([i[k] for i in items]) for k in first})
+    return Batch(data=torch.stack(items))
+
+
 class Dataset:
     """Container for a dataset that's split into training, validation (optional)
     and testing (optional) segments.
@@ -50,6 +294,10 @@ class Dataset:
                 raise ValueError("Dataset requires tuple of length three.")
             return Dataset(*data)
 
+        if isinstance(data, MappedData):
+            split = int(len(data) * train_split)
+            return Dataset(data[:split], data[split:], None)
+
         if hasattr(data, "__next__") or hasattr(data, "__getitem__"):
             return Dataset(data)
 
@@ -57,4 +305,7 @@ class Dataset:
             split = int(data.shape[0] * train_split)
             return Dataset(data[:split], data[split:], None)
 
+        if isinstance(data, Stream):
+            return Dataset(data)
+
         raise TypeError(f"Unknown type `{type(data)}` for Dataset.")
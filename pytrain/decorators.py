@@ -16,27 +16,76 @@ def _annotate(obj, **kwargs):
     return obj
 
 
-def iterates(batch_size: int = None, order: int = None):
+def iterates(
+    batch_size: int = None,
+    order: str = None,
+    prefetch: int = None,
+    workers: int = None,
+    micro_batch: int = None,
+    compile: bool = None,
+):
     def wrapper(function):
-        return _annotate(function, batch_size=batch_size, order=order)
+        return _annotate(
+            function,
+            batch_size=batch_size,
+            order=order,
+            prefetch=prefetch,
+            workers=workers,
+            micro_batch=micro_batch,
+            compile=compile,
+        )
 
     return wrapper
 
 
 def terminates(
-    component=None, iteration: int = None, epoch: int = None, threshold: float = None
+    component=None,
+    iteration: int = None,
+    epoch: int = None,
+    threshold: float = None,
+    patience: int = None,
+    seconds: float = None,
 ):
+    config = dict(
+        iteration=iteration,
+        epoch=epoch,
+        threshold=threshold,
+        patience=patience,
+        seconds=seconds,
+    )
     if component is None:
 
         def wrapper(function):
-            return _annotate(
-                function, iteration=iteration, epoch=epoch, threshold=threshold
-            )
+            return _annotate(function, **config)
 
         return wrapper
 
-    _annotate(component, iteration=iteration, epoch=epoch, threshold=threshold)
+    _annotate(component, **config)
 
 
-def optimizes(component=None, using=None, learning_rate: float = None):
-    _annotate(component, optimizer_class=using, learning_rate=learning_rate)
+def optimizes(
+    component=None,
+    using=None,
+    learning_rate: float = None,
+    accumulate: int = None,
+    autocast: bool = None,
+    checkpoint: bool = None,
+    ema: float = None,
+    swa: bool = None,
+    schedule: str = None,
+    warmup: float = None,
+    reference_batch: int = None,
+):
+    _annotate(
+        component,
+        optimizer_class=using,
+        learning_rate=learning_rate,
+        accumulate=accumulate,
+        autocast=autocast,
+        checkpoint=checkpoint,
+        ema=ema,
+        swa=swa,
+        schedule=schedule,
+        warmup=warmup,
+        reference_batch=reference_batch,
+    )
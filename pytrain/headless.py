@@ -0,0 +1,98 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import re
+import json
+import math
+import time
+
+
+class HeadlessCounter:
+    """Iterates over data on behalf of a headless progress bar, counting the items
+    completed like the counters of the interactive interface.
+    """
+
+    def __init__(self, progress_bar, data, label, remove_when_done):
+        self.progress_bar = progress_bar
+        self.data = data
+        self.label = label.strip()
+        self.remove_when_done = remove_when_done
+        self.total = len(data) if hasattr(data, "__len__") else None
+        self.items_completed = 0
+        self._done = False
+
+    def __iter__(self):
+        try:
+            for item in self.data:
+                yield item
+                self.items_completed += 1
+                self.progress_bar.tick()
+        finally:
+            self.done = True
+
+    @property
+    def done(self):
+        return self._done
+
+    @done.setter
+    def done(self, value):
+        self._done = value
+        if value and self.remove_when_done and self in self.progress_bar.counters:
+            self.progress_bar.counters.remove(self)
+
+
+class HeadlessBar:
+    """Replacement for the interactive progress bar that writes the state of all the
+    counters as JSON lines, at most once per interval, without any terminal.
+    """
+
+    def __init__(self, losses, stream=None, interval=10.0):
+        self.losses = losses
+        self.stream = stream
+        self.interval = interval
+        self.counters = []
+        self.title = None
+        self.deadline = time.monotonic() + interval
+
+    def __call__(self, data=None, label="", remove_when_done=False):
+        counter = HeadlessCounter(self, data, label, remove_when_done)
+        self.counters.append(counter)
+        return counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.emit()
+
+    def tick(self):
+        now = time.monotonic()
+        if now < self.deadline:
+            return
+        self.deadline = now + self.interval
+        self.emit()
+
+    def emit(self):
+        if self.stream is None:
+            return
+
+        counters = []
+        for counter in self.counters:
+            loss = self.losses.get(id(counter))
+            if loss is not None and not math.isfinite(loss):
+                loss = None
+            counters.append(
+                {
+                    "label": counter.label,
+                    "current": counter.items_completed,
+                    "total": counter.total,
+                    "loss": loss,
+                }
+            )
+
+        title = getattr(self.title, "value", self.title)
+        if title is not None:
+            title = re.sub("<[^>]+>", "", title)
+
+        record = {"time": time.time(), "title": title, "counters": counters}
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
@@ -0,0 +1,108 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import functools
+import contextlib
+
+import torch
+import torch.utils.checkpoint
+
+
+def forward_checkpoint(forward, *args, **kwargs):
+    """Forward function for modules being checkpointed, whose activations are then
+    recomputed during the backward pass instead of being stored.
+    """
+    if not torch.is_grad_enabled():
+        return forward(*args, **kwargs)
+    return torch.utils.checkpoint.checkpoint(
+        forward, *args, use_reentrant=False, **kwargs
+    )
+
+
+class MemoryBudget:
+    """Measures the memory of activations saved for the backward pass of each task
+    over its first steps, then checkpoints opted-in modules or splits the batches
+    into smaller micro-batches until the task fits within the budget.
+    """
+
+    NULL = contextlib.nullcontext()
+
+    def __init__(self, budget, steps=3):
+        self.budget = budget
+        self.steps = steps
+        self.tasks = {}
+        self.checkpointed = set()
+
+    def state(self, function):
+        return self.tasks.setdefault(
+            function, {"steps": 0, "peak": 0, "micro_batch": None, "checkpoint": False}
+        )
+
+    def micro_batch(self, function):
+        return self.state(function)["micro_batch"]
+
+    def measure(self, function, modules):
+        state = self.state(function)
+        if state["steps"] >= self.steps:
+            return MemoryBudget.NULL
+        return self._measure(state, modules)
+
+    @contextlib.contextmanager
+    def _measure(self, state, modules):
+        # Parameters saved by operations are not activations, and neither are views.
+        seen = set(p.data_ptr() for m in modules for p in m.parameters())
+        total = 0
+
+        def pack(tensor):
+            nonlocal total
+            if tensor.data_ptr() not in seen:
+                seen.add(tensor.data_ptr())
+                total += tensor.numel() * tensor.element_size()
+            return tensor
+
+        with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+            yield
+        state["peak"] = max(state["peak"], total)
+
+    def update(self, task, modules, batch_size):
+        state = self.state(task.function)
+        if state["steps"] >= self.steps:
+            return
+
+        state["steps"] += 1
+        if state["steps"] < self.steps or state["peak"] <= self.budget:
+            return
+
+        peak = state["peak"] / 2 ** 20
+        if not state["checkpoint"] and self.checkpoint(modules) > 0:
+            state["checkpoint"] = True
+            print(f"💾  Checkpointing activations of {task.name}, {peak:1.1f} MiB.")
+        else:
+            current = state["micro_batch"] or batch_size
+            if current <= 1:
+                print("WARNING:", task.name, f"exceeds memory budget, {peak:1.1f} MiB.")
+                return
+            state["micro_batch"] = max(1, int(current * self.budget / state["peak"]))
+            print(
+                f"💾  Splitting {task.name} into micro-batches of "
+                + f"{state['micro_batch']}, {peak:1.1f} MiB."
+            )
+
+        # Measure again with the new settings over the next steps.
+        state["steps"], state["peak"] = 0, 0
+
+    def checkpoint(self, modules):
+        """Recompute the activations of all modules that opted in, except for those
+        contained within other modules already being checkpointed.
+        """
+        count = 0
+        for module in modules:
+            if module in self.checkpointed:
+                count += 1
+            elif getattr(module, "_pytrain", {}).get("checkpoint", False):
+                # Bound to the module, so copies of the module are checkpointed too.
+                module.forward = functools.partial(forward_checkpoint, module.forward)
+                self.checkpointed.add(module)
+                count += 1
+            else:
+                count += self.checkpoint(list(module.children()))
+        return count
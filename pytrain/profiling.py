@@ -0,0 +1,142 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import sys
+import time
+import contextlib
+import collections
+
+import torch
+
+from .data import Batch
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+PHASES = ("fetch", "forward", "backward", "step", "tick")
+
+
+def parse_trace(trace):
+    """Parse a range of steps to trace like `10:20`, failing before training starts.
+    """
+    try:
+        first, last = (int(s) for s in trace.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid trace `{trace}`, expecting steps N:M.") from None
+    if not 0 < first < last:
+        raise ValueError(f"Invalid trace `{trace}`, expecting steps 0 < N < M.")
+    return first, last
+
+
+class Profiler:
+    """Measures the time spent in each phase of every task and the number of samples
+    processed, optionally recording a Chrome trace for a range of steps.
+    """
+
+    NULL = contextlib.nullcontext()
+
+    def __init__(self, device="cpu", enabled=False, trace=None, filename=None):
+        self.enabled = enabled
+        self.cuda = torch.device(device).type == "cuda"
+        self.timings = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.samples = collections.defaultdict(int)
+
+        self.steps = 0
+        self.trace = parse_trace(trace) if trace is not None else None
+        self.filename = filename or "pytrain-trace.json"
+        self.profile = None
+
+    def measure(self, name, phase):
+        if not self.enabled:
+            return Profiler.NULL
+        return self._measure(name, phase)
+
+    @contextlib.contextmanager
+    def _measure(self, name, phase):
+        if self.cuda:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        yield
+        if self.cuda:
+            torch.cuda.synchronize()
+        self.timings[name, phase] += time.perf_counter() - start
+        self.calls[name, phase] += 1
+
+    def count(self, name, args):
+        if not self.enabled:
+            return
+        for value in args.values():
+            if isinstance(value, Batch):
+                self.samples[name] += len(value)
+                break
+
+    def step(self):
+        self.steps += 1
+        if self.trace is None:
+            return
+
+        first, last = self.trace
+        if self.steps == first:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profile = torch.profiler.profile(
+                activities=activities, record_shapes=True, profile_memory=True
+            )
+            self.profile.__enter__()
+
+        if self.steps == last:
+            self.export()
+
+    def export(self):
+        if self.profile is None:
+            return
+
+        self.profile.__exit__(None, None, None)
+        self.profile.export_chrome_trace(self.filename)
+        print(
+            f"🔬  Exported trace of steps {self.trace[0]} to {self.steps} "
+            + f"to {self.filename}."
+        )
+        self.profile = None
+
+    def memory(self):
+        rss, tensors = None, None
+        if resource is not None:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            rss *= 1 if sys.platform == "darwin" else 1024
+        if self.cuda:
+            tensors = torch.cuda.max_memory_allocated()
+        return rss, tensors
+
+    def report(self):
+        # Traces of runs that ended before the last step are exported too.
+        self.export()
+        if not self.enabled:
+            return
+
+        lines = ["⏱   Average time per step in milliseconds:"]
+        names = sorted(set(name for name, _ in self.timings))
+        for name in names:
+            cells, total = [], 0.0
+            for phase in PHASES:
+                calls = self.calls.get((name, phase), 0)
+                if calls == 0:
+                    continue
+                elapsed = self.timings[name, phase]
+                total += elapsed
+                cells.append(f"{phase}={elapsed * 1000.0 / calls:1.3f}")
+
+            if self.samples.get(name, 0) > 0 and total > 0.0:
+                cells.append(f"samples/s={self.samples[name] / total:1.1f}")
+            lines.append(f"  - {name}  " + "  ".join(cells))
+
+        rss, tensors = self.memory()
+        if rss is not None:
+            lines.append(f"  Peak resident memory: {rss / 2 ** 20:1.1f} MiB.")
+        if tensors is not None:
+            lines.append(f"  Peak tensor memory: {tensors / 2 ** 20:1.1f} MiB.")
+        print("\n".join(lines))
@@ -2,11 +2,16 @@
 
 import os
 import sys
+import ast
+import json
+import math
 import inspect
 import importlib
 import collections
+import concurrent.futures
 
 from .data import Dataset
+from .cache import DatasetCache, fingerprint
 
 
 def is_component(param):
@@ -22,6 +27,29 @@ def is_dataset(param):
     return param.name.split("_")[0] in ("batch", "data", "iterator")
 
 
+PREFIXES = ("task", "show", "main")
+
+SHARED_MEMORY = os.path.join("/dev/shm", "pytrain")
+
+
+def discover(path):
+    """Find the names of all functions that could be tasks in a Python file, from its
+    syntax tree without executing it.
+    """
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    names = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            names.append(node.name)
+        elif isinstance(node, ast.Assign):
+            names.extend(t.id for t in node.targets if isinstance(t, ast.Name))
+        elif isinstance(node, ast.ImportFrom):
+            names.extend(alias.asname or alias.name for alias in node.names)
+    return sorted(set(n for n in names if n.split("_")[0] in PREFIXES))
+
+
 class Function:
     def __init__(self, name, function, signature):
         self.name = name
@@ -65,24 +93,93 @@ class Registry:
 
         return {cp: _create(cp).to(device) for cp in self.components}
 
-    def create_datasets(self):
-        return {ds: Dataset.from_data(ds()) for ds in self.datasets}
+    def create_datasets(self, shared=None):
+        shared, cache, served = shared or {}, None, None
+        if self.config.get("--cache"):
+            limit = float(self.config.get("--cache-limit") or 16) * 2 ** 30
+            cache = DatasetCache(os.path.join(".pytrain", "datasets"), limit)
+        if self.config.get("--attach"):
+            served = DatasetCache(self.config.get("--shm") or SHARED_MEMORY, math.inf)
+
+        return {
+            ds: shared[ds] if ds in shared else self.create_dataset(ds, cache, served)
+            for ds in self.datasets
+        }
+
+    def create_dataset(self, ds, cache=None, served=None):
+        # Datasets served by `pytrain serve` are attached without any copies.
+        if served is not None and fingerprint(ds) is not None:
+            dataset = served.load(fingerprint(ds))
+            if dataset is not None:
+                return dataset
+
+        key = fingerprint(ds) if cache is not None else None
+        if key is not None:
+            dataset = cache.load(key)
+            if dataset is not None:
+                return dataset
+
+        dataset = Dataset.from_data(ds())
+        if key is not None:
+            cache.store(key, dataset)
+        return dataset
 
     def load(self):
         sys.path.append(os.getcwd())
 
+        paths = []
         for root, _, files in os.walk(self.config.get("--path") or "train"):
             if root.endswith("__pycache__"):
                 continue
 
-            for filename in files:
+            for filename in sorted(files):
                 if filename.startswith("_") or not filename.endswith(".py"):
                     continue
-                if (self.config.get("--include") or "train_") not in filename:
-                    continue
+                paths.append(os.path.join(root, filename))
+
+        include = self.config.get("--include") or "train_"
+        for path, names in self.scan(paths).items():
+            # Modules are selected by filename, or by the functions they contain.
+            if include not in os.path.basename(path):
+                names = [n for n in names if include in n]
+            if len(names) == 0:
+                continue
 
-                module = self.import_module(os.path.join(root, filename))
-                self.load_module(module)
+            module = self.import_module(path)
+            self.load_module(module, names)
+
+    def scan(self, paths, index=os.path.join(".pytrain", "index.json")):
+        """Discover the functions in each file, reusing the results of previous runs
+        for files that were not modified since.
+        """
+        try:
+            with open(index, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+        stamps = {path: os.stat(path).st_mtime_ns for path in paths}
+        missing = [p for p in paths if cache.get(p, {}).get("mtime") != stamps[p]]
+        if len(missing) > 0:
+            executor = concurrent.futures.ThreadPoolExecutor
+            if len(missing) > 32:
+                executor = concurrent.futures.ProcessPoolExecutor
+            with executor() as pool:
+                for path, names in zip(missing, pool.map(discover, missing)):
+                    cache[path] = {"mtime": stamps[path], "names": names}
+
+            # Each process writes its own file, e.g. trials of a sweep, and the index
+            # is only a cache so read-only directories still work.
+            tmp = f"{index}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(index), exist_ok=True)
+                with open(tmp, "w") as f:
+                    json.dump(cache, f)
+                os.replace(tmp, index)
+            except OSError:
+                pass
+
+        return {path: cache[path]["names"] for path in paths}
 
     def import_module(self, path):
         name = os.path.split(path)[1].replace(".py", "").replace("/", ".")
@@ -92,10 +189,12 @@ class Registry:
         spec.loader.exec_module(module)
         return module
 
-    def load_module(self, module):
+    def load_module(self, module, names=None):
         module_name = module.__name__.split(".")[-1]
-        for name in dir(module):
-            if not name.split("_")[0] in ("task", "show", "main"):
+        for name in names or dir(module):
+            if not name.split("_")[0] in PREFIXES:
+                continue
+            if not hasattr(module, name):
                 continue
 
             obj = getattr(module, name)
@@ -0,0 +1,90 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import itertools
+
+import torch
+
+
+def slice_epochs(orders, batch_size):
+    """Split each precomputed epoch of indices into batches, which are views into
+    the same index tensor and don't require allocations per step.
+    """
+    for order in orders:
+        for i in range(0, len(order), batch_size):
+            yield order[i : i + batch_size]
+
+
+def sample_ordered(data, batch_size, generator=None):
+    order = torch.arange(len(data))
+    return slice_epochs(itertools.repeat(order), batch_size)
+
+
+def sample_shuffled(data, batch_size, generator=None):
+    length = len(data)
+    orders = (torch.randperm(length, generator=generator) for _ in itertools.count())
+    return slice_epochs(orders, batch_size)
+
+
+def sample_random(data, batch_size, generator=None):
+    length = len(data)
+    orders = (
+        torch.randint(0, length, size=(length,), generator=generator)
+        for _ in itertools.count()
+    )
+    return slice_epochs(orders, batch_size)
+
+
+def sample_weighted(data, batch_size, generator=None):
+    if not hasattr(data, "weights"):
+        raise ValueError("Weighted sampling requires dataset with `weights`.")
+
+    weights = torch.as_tensor(data.weights, dtype=torch.float).flatten()
+    orders = (
+        torch.multinomial(weights, len(weights), replacement=True, generator=generator)
+        for _ in itertools.count()
+    )
+    return slice_epochs(orders, batch_size)
+
+
+def sample_stratified(data, batch_size, generator=None):
+    if not hasattr(data, "labels"):
+        raise ValueError("Stratified sampling requires dataset with `labels`.")
+
+    labels = torch.as_tensor(data.labels).flatten()
+    _, classes, counts = torch.unique(labels, return_inverse=True, return_counts=True)
+    starts = torch.cumsum(counts, dim=0) - counts
+
+    def _orders():
+        for _ in itertools.count():
+            order = torch.randperm(len(labels), generator=generator)
+            cls = classes[order]
+
+            # Rank items within their class, then interleave classes by relative
+            # rank so every batch has roughly the same proportions as the data.
+            _, grouped = torch.sort(cls, stable=True)
+            rank = torch.empty_like(grouped)
+            rank[grouped] = torch.arange(len(labels)) - starts[cls[grouped]]
+            position = (rank.float() + 0.5) / counts[cls].float()
+            yield order[torch.argsort(position)]
+
+    return slice_epochs(_orders(), batch_size)
+
+
+SAMPLERS = {
+    "ordered": sample_ordered,
+    "shuffled": sample_shuffled,
+    "random": sample_random,
+    "weighted": sample_weighted,
+    "stratified": sample_stratified,
+    # Default sampling order for each of the modes.
+    "training": sample_shuffled,
+    "validation": sample_ordered,
+}
+
+
+def get_sampler(order):
+    if callable(order):
+        return order
+    if order not in SAMPLERS:
+        raise ValueError(f"Unknown sampling order `{order}`.")
+    return SAMPLERS[order]
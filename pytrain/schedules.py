@@ -0,0 +1,84 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import math
+
+
+def anneal(start, end, fraction):
+    return end + (start - end) * 0.5 * (1.0 + math.cos(math.pi * min(fraction, 1.0)))
+
+
+def warmup_steps(steps, warmup):
+    """Convert a warmup given as a fraction of the total steps to a number of steps.
+    """
+    if isinstance(warmup, float) and warmup < 1.0:
+        return int(warmup * steps) if steps is not None else 0
+    return int(warmup)
+
+
+def schedule_constant(steps, warmup=0):
+    warmup = warmup_steps(steps, warmup)
+    return lambda step: min(1.0, (step + 1) / warmup) if warmup > 0 else 1.0
+
+
+def schedule_linear(steps, warmup=0.05):
+    """Constant learning rate after a linear warmup, to be scaled by the ratio of
+    effective batch size to the reference batch size.
+    """
+    return schedule_constant(steps, warmup)
+
+
+def schedule_cosine(steps, warmup=0.05):
+    warmup = warmup_steps(steps, warmup)
+
+    def _factor(step):
+        if step < warmup:
+            return (step + 1) / warmup
+        if steps is None or steps <= warmup:
+            return 1.0
+        return anneal(1.0, 0.0, (step - warmup) / (steps - warmup))
+
+    return _factor
+
+
+def schedule_onecycle(steps, warmup=0.3):
+    """Increase the learning rate from 1/25th of its value then anneal it towards
+    zero, as in the one-cycle policy.
+    """
+    warmup = max(1, warmup_steps(steps, warmup))
+
+    def _factor(step):
+        if step < warmup or steps is None:
+            return anneal(1.0 / 25.0, 1.0, step / warmup)
+        return anneal(1.0, 1.0 / 25e4, (step - warmup) / max(1, steps - warmup))
+
+    return _factor
+
+
+def schedule_cyclic(steps, warmup=0):
+    """Previous default that cycles between 1/100th of the learning rate and its
+    full value, over a fixed 300 steps regardless of the total number of steps.
+    """
+
+    def _factor(step):
+        position = step % 300
+        fraction = position / 100 if position < 100 else (300 - position) / 200
+        return 1e-2 + (1.0 - 1e-2) * fraction
+
+    return _factor
+
+
+SCHEDULES = {
+    "constant": schedule_constant,
+    "linear": schedule_linear,
+    "cosine": schedule_cosine,
+    "onecycle": schedule_onecycle,
+    "cyclic": schedule_cyclic,
+}
+
+
+def get_schedule(schedule):
+    if callable(schedule):
+        return schedule
+    if schedule not in SCHEDULES:
+        raise ValueError(f"Unknown learning rate schedule `{schedule}`.")
+    return SCHEDULES[schedule]
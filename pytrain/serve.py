@@ -0,0 +1,47 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import os
+import math
+import time
+import shutil
+
+from .cache import DatasetCache, fingerprint
+from .registry import Registry
+
+
+def main(config):
+    """Construct all the datasets into memory-mapped files in shared memory, where
+    other processes attach to them without copies, until interrupted.
+    """
+    registry = Registry(config)
+    registry.load()
+
+    directory = config["--shm"]
+    server = DatasetCache(directory, math.inf)
+    stored = []
+    for ds in sorted(registry.datasets, key=lambda ds: ds.__qualname__):
+        key = fingerprint(ds)
+        if key is None:
+            print("WARNING:", ds.__qualname__, "has no source to identify it.")
+            continue
+        if server.load(key) is None:
+            if not server.store(key, registry.create_dataset(ds)):
+                print("WARNING:", ds.__qualname__, "has splits that aren't tensors.")
+                continue
+            stored.append(key)
+        print(f"📦  Serving {ds.__qualname__} from {os.path.join(directory, key)}.")
+
+    if len(stored) == 0:
+        return 0
+
+    print("📡  Serving datasets until interrupted with Control-C.")
+    try:
+        while True:
+            time.sleep(3600.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Processes that attached keep their mappings after the files are removed.
+        for key in stored:
+            shutil.rmtree(os.path.join(directory, key), ignore_errors=True)
+    return 0
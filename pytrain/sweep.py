@@ -0,0 +1,195 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import os
+import ast
+import sys
+import math
+import random
+import shutil
+import asyncio
+import itertools
+import concurrent.futures
+
+import torch
+import torch.multiprocessing
+
+from .cache import SPLITS
+from .registry import Registry
+from .checkpoint import Checkpointer
+
+
+SEARCHES = ("grid", "random", "halving")
+
+
+def parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def parse_space(specs):
+    """Parse settings to sweep like `learning_rate=1e-3,1e-2` as lists of values, or
+    `learning_rate=1e-4:1e-1` as ranges to sample from.
+    """
+    space = {}
+    for spec in specs:
+        key, sep, values = spec.partition("=")
+        if sep == "" or values == "":
+            raise ValueError(f"Invalid setting `{spec}`, expecting KEY=VALUES.")
+        if ":" in values:
+            low, high = values.split(":")
+            space[key] = (parse_value(low), parse_value(high))
+        else:
+            space[key] = [parse_value(v) for v in values.split(",")]
+    return space
+
+
+def sample_value(values, generator):
+    if isinstance(values, list):
+        return generator.choice(values)
+
+    low, high = values
+    if isinstance(low, int) and isinstance(high, int):
+        return generator.randint(low, high)
+    # Positive ranges are sampled uniformly in log-space, as for learning rates.
+    if low > 0 and high > 0:
+        return math.exp(generator.uniform(math.log(low), math.log(high)))
+    return generator.uniform(low, high)
+
+
+def create_trials(space, search, trials, generator):
+    if search != "random" and all(isinstance(v, list) for v in space.values()):
+        keys = list(space.keys())
+        return [dict(zip(keys, v)) for v in itertools.product(*space.values())]
+    return [
+        {k: sample_value(v, generator) for k, v in space.items()}
+        for _ in range(trials)
+    ]
+
+
+def dataset_name(ds):
+    return ds.__module__ + "." + ds.__qualname__
+
+
+def share_datasets(registry):
+    """Construct all the datasets once, moving the tensors to shared memory so
+    trials in other processes can read them without copies.
+    """
+    datasets = {}
+    for ds, dataset in registry.create_datasets().items():
+        splits = [getattr(dataset, s) for s in SPLITS]
+        if not all(s is None or isinstance(s, torch.Tensor) for s in splits):
+            continue
+        for split in splits:
+            if split is not None:
+                split.share_memory_()
+        datasets[dataset_name(ds)] = dataset
+    return datasets
+
+
+def configure(registry, values, epochs):
+    """Override decorator settings with the values of a trial, for all functions and
+    components or only those with the given name, e.g. `MyModel.learning_rate`.
+    """
+    objects = [f.function for f in registry.functions] + list(registry.components)
+    for key, value in dict(values, epoch=epochs).items():
+        target, _, name = key.rpartition(".")
+        for obj in objects:
+            if target not in ("", obj.__name__):
+                continue
+            config = getattr(obj, "_pytrain", {})
+            config[name] = value
+            setattr(obj, "_pytrain", config)
+
+
+def run_trial(config, values, epochs, directory, datasets):
+    from .application import Application
+
+    sys.stdout = open(os.devnull, "w")
+    torch.set_num_threads(int(config["--threads"]))
+
+    registry = Registry(config)
+    registry.load()
+    configure(registry, values, epochs)
+
+    names = {ds: dataset_name(ds) for ds in registry.datasets}
+    shared = {ds: datasets[n] for ds, n in names.items() if n in datasets}
+    loop = asyncio.new_event_loop()
+    application = Application(
+        loop, config["--device"], registry, datasets=shared, save=False
+    )
+    application.checkpoints = Checkpointer(directory, keep=1)
+    application.run()
+
+    losses = [v for v in application.results.values() if v is not None]
+    return sum(losses) if len(losses) > 0 else math.inf
+
+
+def main(config):
+    search = config.get("--search") or "grid"
+    if search not in SEARCHES:
+        raise ValueError(f"Unknown search strategy `{search}`.")
+
+    generator = random.Random()
+    space = parse_space(config["--set"])
+    trials = create_trials(space, search, int(config["--trials"]), generator)
+
+    registry = Registry(config)
+    registry.load()
+    if len(registry.functions) == 0:
+        print(f"ERROR: No tasks found in specified directory.")
+        return 1
+    datasets = share_datasets(registry)
+
+    jobs = int(config.get("--jobs") or 1)
+    options = {
+        "--jobs": "1",
+        "--threads": str(max(1, torch.get_num_threads() // jobs)),
+        "--headless": True,
+        "--log": os.devnull,
+        "--checkpoint": "1" if search == "halving" else "0",
+    }
+    root = os.path.join(".pytrain", "sweep")
+    shutil.rmtree(root, ignore_errors=True)
+    directories = [os.path.join(root, f"{i:04d}") for i in range(len(trials))]
+
+    print(f"🧪  Sweeping {len(trials)} trial(s) with {search} search.")
+    context = torch.multiprocessing.get_context("spawn")
+    executor = concurrent.futures.ProcessPoolExecutor(jobs, mp_context=context)
+
+    survivors, losses = list(range(len(trials))), {}
+    epochs, eta = int(config["--epochs"]), int(config["--eta"])
+    with executor as pool:
+        while True:
+            # Successive rounds of halving resume trials from their checkpoints.
+            options["--resume"] = search == "halving" and len(losses) > 0
+            futures = {
+                pool.submit(
+                    run_trial,
+                    dict(config, **options),
+                    trials[i],
+                    epochs,
+                    directories[i],
+                    datasets,
+                ): i
+                for i in survivors
+            }
+            for future in concurrent.futures.as_completed(futures):
+                i = futures[future]
+                try:
+                    losses[i] = future.result()
+                except Exception as e:
+                    print("WARNING: Trial", i, "failed with", repr(e))
+                    losses[i] = math.inf
+                print(f"  - #{i} {trials[i]} after {epochs} epoch(s): {losses[i]}")
+
+            if search != "halving" or len(survivors) <= 1:
+                break
+            count = max(1, len(survivors) // eta)
+            survivors = sorted(survivors, key=losses.get)[:count]
+            epochs *= eta
+
+    best = min(survivors, key=losses.get)
+    print(f"🏆  Best trial #{best} {trials[best]} with loss {losses[best]}.")
+    return 0
@@ -0,0 +1,58 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import math
+import time
+
+
+def _minimum(values):
+    values = [v for v in values if v is not None]
+    return min(values) if len(values) > 0 else None
+
+
+class Termination:
+    """Decides when a group of components has finished training, either because the
+    loss went below a threshold, the validation loss stopped improving for a number
+    of epochs, or the budget of wall-clock time was used up.
+    """
+
+    def __init__(self, threshold=None, patience=None, seconds=None):
+        self.threshold = threshold
+        self.patience = patience
+        self.seconds = seconds
+
+        self.start = time.monotonic()
+        self.best = math.inf
+        self.waiting = 0
+        self.reason = None
+
+    @classmethod
+    def from_config(cls, objects):
+        configs = [getattr(obj, "_pytrain", {}) for obj in objects]
+        return Termination(
+            threshold=_minimum(c.get("threshold") for c in configs),
+            patience=_minimum(c.get("patience") for c in configs),
+            seconds=_minimum(c.get("seconds") for c in configs),
+        )
+
+    def expired(self):
+        if self.seconds is None:
+            return False
+        if time.monotonic() - self.start >= self.seconds:
+            self.reason = f"time budget of {self.seconds}s used up"
+        return self.reason is not None
+
+    def update(self, training=None, validation=None):
+        loss = validation if validation is not None else training
+        if self.threshold is not None and loss is not None:
+            if loss <= self.threshold:
+                self.reason = f"loss {loss:1.4e} reached threshold {self.threshold}"
+
+        if self.patience is not None and validation is not None:
+            if validation < self.best:
+                self.best, self.waiting = validation, 0
+            else:
+                self.waiting += 1
+            if self.waiting >= self.patience:
+                self.reason = f"no improvement in {self.patience} epoch(s)"
+
+        return self.expired() or self.reason is not None
@@ -1,25 +1,122 @@
 # PyTrain — Copyright (c) 2019, Alex J. Champandard.
 
+import os
+import types
+import inspect
 import hashlib
 import itertools
+import contextlib
+import collections
+import concurrent.futures
 
 import torch
+import torch.distributed as dist
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 
-from .data import Batch
+from .data import Batch, Stream, Staging, collate
+from .samplers import get_sampler
+from .profiling import Profiler
+from .schedules import get_schedule
+from .memory import MemoryBudget
+from .registry import Function
 
 
-def iterate_ordered(data, batch_size):
+def fetch_batch(data, indices, number=None, device=None):
+    b = Batch.from_data(data[indices])
+    b.number = number
+    return b if device is None else b.to(device)
+
+
+def iterate_batches(data, sampler):
+    for i, indices in enumerate(sampler):
+        yield fetch_batch(data, indices, number=i)
+
+
+def shard_indices(sampler, rank, world):
+    """Split each batch of indices between all the workers, repeating the items of
+    undersized batches so that no worker is left with an empty batch.
+    """
+    for indices in sampler:
+        if len(indices) < world:
+            indices = indices.repeat(world)
+        yield indices[rank::world]
+
+
+def iterate_prefetch(data, sampler, device, prefetch, workers=1):
+    """Assemble the upcoming batches on a pool of threads, and hand them over in
+    order through a bounded queue of pending results.
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    pending = collections.deque()
+    try:
+        for i, indices in enumerate(sampler):
+            pending.append(pool.submit(fetch_batch, data, indices, i, device))
+            if len(pending) > prefetch:
+                yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def iterate_stream(items, batch_size):
+    """Group the items of a stream into batches, except items that are already
+    batches which are passed through as they are.
+    """
+    items = iter(items)
     for i in itertools.count():
-        indices = torch.arange(i * batch_size, (i + 1) * batch_size, step=+1)
-        b = Batch.from_data(data[indices % len(data)])
+        chunk = list(itertools.islice(items, 1))
+        if len(chunk) == 0:
+            return
+
+        if not isinstance(chunk[0], Batch):
+            chunk.extend(itertools.islice(items, batch_size - 1))
+            b = collate(chunk)
+        else:
+            b = chunk[0]
         b.number = i
         yield b
 
 
-def iterate_random(data, batch_size):
-    while True:
-        indices = torch.randint(0, len(data), size=(batch_size,))
-        yield Batch.from_data(data[indices])
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def forward_fp32(self, *args, **kwargs):
+    """Forward function for components that opted out of mixed precision, running
+    the original forward with autocast disabled on single-precision inputs.
+    """
+    device_type = "cpu"
+    for arg in args:
+        if isinstance(arg, torch.Tensor):
+            device_type = arg.device.type
+            break
+
+    args = [
+        a.float() if isinstance(a, torch.Tensor) and a.is_floating_point() else a
+        for a in args
+    ]
+    with torch.autocast(device_type, enabled=False):
+        return type(self).forward(self, *args, **kwargs)
+
+
+def accumulate(total, value):
+    """Add a loss or dictionary of metrics to a running total kept on the device, so
+    values are only read back when they're reported.
+    """
+    if isinstance(value, dict):
+        total = total if total is not None else {}
+        return dict(total, **{k: accumulate(total.get(k), v) for k, v in value.items()})
+    if not isinstance(value, torch.Tensor):
+        value = torch.tensor(float(value))
+    if total is None:
+        return value.detach().to(torch.float32, copy=True)
+    return total.add_(value.detach())
+
+
+def summarize(total, steps):
+    if isinstance(total, dict):
+        return {k: summarize(v, steps) for k, v in total.items()}
+    return total.item() / steps
 
 
 def get_config(obj, name, default):
@@ -27,12 +124,70 @@ def get_config(obj, name, default):
 
 
 class BasicTrainer:
-    def __init__(self, device, lr=1e-2):
+    def __init__(
+        self,
+        device,
+        lr=1e-2,
+        precision="fp32",
+        profiler=None,
+        compile=False,
+        shared=False,
+        budget=None,
+    ):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision `{precision}` for training.")
+
         self.device = device
         self.learning_rate = lr
+        self.precision = precision
+        self.compile = compile
+        self.compiled = {}
+        self.shared = shared
+        self.memory = MemoryBudget(budget) if budget is not None else None
+        self.dtype = PRECISIONS[precision]
+        self.device_type = torch.device(device).type
+        self.scaler = torch.amp.GradScaler(
+            self.device_type, enabled=precision == "fp16"
+        )
+        self.profiler = profiler or Profiler(device)
         self.samples = None
+        self.generator = None
         self.optimizers = []
         self.schedulers = []
+        self.accumulate = {}
+        self.ticks = {}
+        self.users = {}
+        self.optimized = {}
+        self.trained = set()
+        self.averages = {}
+        self.averaged = {}
+        self.swapped = set()
+        self.staging = {}
+        self.streams = {}
+
+        self.rank, self.world = 0, 1
+        if dist.is_available() and dist.is_initialized():
+            self.rank, self.world = dist.get_rank(), dist.get_world_size()
+
+            # All workers draw the same sample order, then each takes its shard.
+            seed = torch.randint(0, 2 ** 62, size=(1,))
+            dist.broadcast(seed, src=0)
+            self.generator = torch.Generator().manual_seed(int(seed))
+            torch.manual_seed(torch.initial_seed() + self.rank)
+
+    def fork(self):
+        """Create a trainer with the same settings, to optimize other components
+        independently from this one.
+        """
+        return BasicTrainer(
+            self.device,
+            self.learning_rate,
+            self.precision,
+            self.profiler,
+            self.compile,
+            self.shared,
+            self.memory.budget if self.memory is not None else None,
+        )
 
     def setup_function(self, function, args, mode):
         for key in args.keys():
@@ -44,70 +199,320 @@ class BasicTrainer:
 
             if key.split("_")[0] not in ("batch", "iterator"):
                 continue
-            options = {"training": iterate_random, "validation": iterate_ordered}
-            iterator = options[function.config("order", None) or mode]
-            args[key] = iterator(args[key], function.config("batch_size", 32))
+            args[key] = self.iterate(function, args[key], mode)
+
+        if function.config("compile", self.compile):
+            function = self.compile_function(function)
         return function, args
 
-    def setup_components(self, components):
+    def compile_function(self, function):
+        """Compile the task with inductor once per run, storing the generated code in
+        a cache that's reused by later runs for the same graphs and input shapes.
+        """
+        if function.function not in self.compiled:
+            cache = os.path.abspath(os.path.join(".pytrain", "inductor"))
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache)
+
+            import torch._inductor.config as inductor
+
+            inductor.fx_graph_cache = True
+            if hasattr(inductor, "autograd_cache"):
+                inductor.autograd_cache = True
+
+            compiled = torch.compile(function.function, backend="inductor")
+            compiled._pytrain = function.function._pytrain
+            self.compiled[function.function] = Function(
+                function.name, compiled, function.signature
+            )
+        return self.compiled[function.function]
+
+    def iterate(self, function, data, mode):
+        batch_size = function.config("batch_size", 32)
+        if isinstance(data, Stream) or not hasattr(data, "__getitem__"):
+            return self.stream(data, batch_size, mode)
+
+        sampler = get_sampler(function.config("order", None) or mode)
+        sampler = sampler(data, batch_size * self.world, self.generator)
+        if self.world > 1:
+            sampler = shard_indices(sampler, self.rank, self.world)
+
+        prefetch = function.config("prefetch", 0)
+        if prefetch > 0:
+            workers = function.config("workers", 1)
+            return iterate_prefetch(data, sampler, self.device, prefetch, workers)
+        return iterate_batches(data, sampler)
+
+    def stream(self, data, batch_size, mode):
+        if not isinstance(data, Stream):
+            data = self.streams.setdefault(data, Stream(data))
+
+        items = data.items(self.rank, self.world, self.generator)
+        if mode == "training":
+            items = data.shuffled(items, self.generator)
+        return iterate_stream(items, batch_size)
+
+    def setup_components(self, components, steps=None, batch_size=None):
         opt_class = torch.optim.Adam
-        sch_class = torch.optim.lr_scheduler.CyclicLR
 
-        all_params, lr = [], self.learning_rate
+        # One parameter group per component, each with its own learning rate.
+        groups, owners, seen = [], [], set()
         for cp in components:
-            params = list(cp.parameters())
-            if all(p.requires_grad == False for p in params):
+            params = [p for p in cp.parameters() if p.requires_grad]
+            params = [p for p in params if id(p) not in seen]
+            seen.update(id(p) for p in params)
+            if len(params) == 0:
                 print("WARNING:", cp, id(cp), "requires no gradients.")
                 continue
 
-            all_params.extend(params)
-            lr = get_config(cp, "learning_rate", lr)
+            lr = get_config(cp, "learning_rate", self.learning_rate)
+            groups.append({"params": params, "lr": lr})
+            owners.append(cp)
             opt_class = get_config(cp, "optimizer_class", opt_class)
-            sch_class = get_config(cp, "scheduler_class", sch_class)
-
-        optimizer = opt_class(all_params, lr=lr)
-        scheduler = sch_class(
-            optimizer,
-            base_lr=lr * 1e-2,
-            max_lr=lr,
-            mode="triangular",
-            step_size_up=100,
-            step_size_down=200,
-            cycle_momentum=False,
-        )
+
+        accumulate = max(get_config(cp, "accumulate", 1) for cp in components)
+
+        # Schedules are based on the number of optimizer steps and samples per step.
+        if steps is not None:
+            steps = max(1, steps // accumulate)
+        if batch_size is not None:
+            batch_size *= self.world * accumulate
+        factors = [self.create_schedule(cp, steps, batch_size) for cp in owners]
+
+        for cp in components:
+            if self.dtype is not None and not get_config(cp, "autocast", True):
+                cp.forward = types.MethodType(forward_fp32, cp)
+
+        if self.world > 1:
+            for group in groups:
+                for param in group["params"]:
+                    dist.broadcast(param.data, src=0)
+
+        # Groups of a stage can all share a single optimizer, stepped only once.
+        if self.shared and len(self.optimizers) > 0:
+            optimizer, scheduler = self.optimizers[0], self.schedulers[0]
+            for group, factor in zip(groups, factors):
+                optimizer.add_param_group(group)
+
+                # Schedules of new groups start from the scheduler's current step.
+                start = scheduler.last_epoch
+                scheduler.lr_lambdas.append(lambda i, f=factor, s=start: f(i - s))
+                scheduler.base_lrs.append(group["lr"])
+                group["initial_lr"] = group["lr"]
+                group["lr"] = group["lr"] * factor(0)
+            self.accumulate[optimizer] = max(self.accumulate[optimizer], accumulate)
+            self.users[optimizer] += 1
+            self.optimized.update((cp, optimizer) for cp in owners)
+            self.setup_averages(optimizer, components)
+            return optimizer
+
+        optimizer = opt_class(groups, **self.optimizer_options(opt_class))
         self.optimizers.append(optimizer)
-        self.schedulers.append(scheduler)
+        self.schedulers.append(torch.optim.lr_scheduler.LambdaLR(optimizer, factors))
+        self.accumulate[optimizer] = accumulate
+        self.ticks[optimizer] = 0
+        self.users[optimizer] = 1
+        self.optimized.update((cp, optimizer) for cp in owners)
+        self.averaged[optimizer] = []
+        self.setup_averages(optimizer, components)
         return optimizer
 
+    def setup_averages(self, optimizer, components):
+        """Keep copies of the parameters of components that opted into exponential
+        moving averages, or stochastic weight averaging over epochs.
+        """
+        for cp in components:
+            decay, swa = get_config(cp, "ema", None), get_config(cp, "swa", False)
+            if decay is None and not swa:
+                continue
+            if decay is not None and swa:
+                raise ValueError("Components can't use both `ema` and `swa` together.")
+
+            names, params = zip(
+                *[(n, p) for n, p in cp.named_parameters() if p.requires_grad]
+            )
+            self.averages[cp] = {
+                "kind": "ema" if decay is not None else "swa",
+                "decay": decay,
+                "count": 0,
+                "names": list(names),
+                "params": list(params),
+                "copies": [p.detach().clone() for p in params],
+            }
+            self.averaged[optimizer].append(cp)
+
+    def optimizer_options(self, opt_class):
+        """Select the fused implementation of optimizers on accelerators, or else the
+        multi-tensor implementation, if the optimizer class supports them.
+        """
+        try:
+            parameters = inspect.signature(opt_class).parameters
+        except (TypeError, ValueError):
+            return {}
+
+        if "fused" in parameters and self.device_type == "cuda":
+            return {"fused": True}
+        if "foreach" in parameters:
+            return {"foreach": True}
+        return {}
+
+    def create_schedule(self, cp, steps, batch_size):
+        """Build the function of the step that multiplies a component's learning rate,
+        from the schedule it's configured with and the total number of steps.
+        """
+        name = get_config(cp, "schedule", "cosine")
+        warmup = get_config(cp, "warmup", None)
+        schedule = get_schedule(name)
+        factor = schedule(steps) if warmup is None else schedule(steps, warmup)
+        if name != "linear" or batch_size is None:
+            return factor
+
+        # Learning rates grow linearly with the batch size, relative to a reference.
+        scale = batch_size / get_config(cp, "reference_batch", 256)
+        return lambda step: scale * factor(step)
+
+    def release(self, optimizer):
+        """Stop optimizing the components of a group, freeing the optimizer state
+        once no other group is sharing the optimizer.
+        """
+        self.users[optimizer] -= 1
+        if self.users[optimizer] > 0:
+            return
+
+        index = self.optimizers.index(optimizer)
+        del self.optimizers[index]
+        del self.schedulers[index]
+        del self.accumulate[optimizer]
+        del self.ticks[optimizer]
+        del self.users[optimizer]
+        self.optimized = {k: v for k, v in self.optimized.items() if v is not optimizer}
+        for cp in self.averaged.pop(optimizer):
+            del self.averages[cp]
+
     def prepare(self):
         for optimizer in self.optimizers:
-            optimizer.zero_grad()
+            if self.ticks[optimizer] % self.accumulate[optimizer] == 0:
+                optimizer.zero_grad()
         self.samples = 0
+        self.trained.clear()
 
-    def run_training(self, context):
-        task, args = context
+    def fetch(self, task, args):
         args = args.copy()
         for key in args:
-            if key.split("_")[0] == "batch":
-                args[key] = next(args[key]).to(self.device)
+            if key.split("_")[0] != "batch":
+                continue
 
+            staging = None
+            if self.device_type == "cuda":
+                staging = self.staging.setdefault((task.name, key), Staging())
+            args[key] = next(args[key]).to(
+                self.device, non_blocking=True, staging=staging
+            )
+        return args
+
+    def run_training(self, context):
+        task, args = context
+        try:
+            with self.profiler.measure(task.name, "fetch"):
+                args = self.fetch(task, args)
+        except StopIteration:
+            args = None
+
+        # Workers stop together, as finite streams may not be split evenly.
+        if self.synchronize(args is None):
+            return "break"
+
+        self.profiler.count(task.name, args)
         self.samples += 1
-        loss = task.function(**args)
-        if isinstance(loss, float):
-            return loss
+        micro_batch = task.config("micro_batch", None)
+        if self.memory is not None:
+            micro_batch = self.memory.micro_batch(task.function) or micro_batch
+
+        if micro_batch is None:
+            with self.profiler.measure(task.name, "forward"), self.autocast():
+                with self.measure_memory(task, args):
+                    loss = task.function(**args)
+            with self.profiler.measure(task.name, "backward"):
+                total = self.backward(loss)
         else:
-            loss.backward()
-            return loss.item()
+            total = None
+            for weight, chunk in self.split_arguments(args, micro_batch):
+                with self.profiler.measure(task.name, "forward"), self.autocast():
+                    with self.measure_memory(task, chunk):
+                        loss = task.function(**chunk)
+                with self.profiler.measure(task.name, "backward"):
+                    loss = self.backward(loss, weight)
+                if loss is None or isinstance(loss, str):
+                    return loss
+                total = accumulate(total, loss)
+
+        if self.memory is not None:
+            batches = [len(a) for a in args.values() if isinstance(a, Batch)]
+            modules = [a for a in args.values() if isinstance(a, torch.nn.Module)]
+            self.memory.update(task, modules, micro_batch or max(batches, default=1))
+
+        # Only optimizers of components this task trained are stepped afterwards.
+        for value in args.values():
+            if isinstance(value, torch.nn.Module) and value in self.optimized:
+                self.trained.add(self.optimized[value])
+        return total
+
+    def measure_memory(self, task, args):
+        if self.memory is None:
+            return contextlib.nullcontext()
+        modules = [a for a in args.values() if isinstance(a, torch.nn.Module)]
+        return self.memory.measure(task.function, modules)
+
+    def backward(self, output, weight=1.0):
+        """Back-propagate the loss of a task, or its "loss" metric, and return the
+        values detached but still on the device to avoid synchronizing.
+        """
+        loss = output.get("loss") if isinstance(output, dict) else output
+        if not isinstance(loss, torch.Tensor):
+            return output
+        if weight != 1.0:
+            loss = loss * weight
+        self.scaler.scale(loss).backward()
+
+        if isinstance(output, dict):
+            return {k: torch.as_tensor(v).detach() * weight for k, v in output.items()}
+        return loss.detach()
+
+    def autocast(self):
+        if self.dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(self.device_type, dtype=self.dtype)
+
+    def split_arguments(self, args, size):
+        """Divide all the batches of a task into micro-batches, each weighted by its
+        fraction of the full batch so the accumulated gradients are the same.
+        """
+        keys = [key for key in args if key.split("_")[0] == "batch"]
+        if len(keys) == 0:
+            yield 1.0, args
+            return
+
+        length = len(args[keys[0]])
+        chunks = {key: args[key].split(size) for key in keys}
+        for i in range(min(len(c) for c in chunks.values())):
+            chunk = dict(args, **{key: chunks[key][i] for key in keys})
+            yield len(chunk[keys[0]]) / length, chunk
 
     def run_validation(self, context):
         task, args = context
-        args = args.copy()
-        for key in args:
-            if key.split("_")[0] == "batch":
-                args[key] = next(args[key]).to(self.device)
+        try:
+            with self.profiler.measure(task.name, "fetch"):
+                args = self.fetch(task, args)
+        except StopIteration:
+            args = None
+
+        # Workers stop together, as finite streams may not be split evenly.
+        if self.synchronize(args is None):
+            return "break"
 
-        with torch.no_grad():
-            score = task.function(**args)
+        self.profiler.count(task.name, args)
+        with self.profiler.measure(task.name, "forward"):
+            with torch.no_grad(), self.autocast():
+                score = task.function(**args)
         return score
 
     def report(self, loss):
@@ -117,12 +522,145 @@ class BasicTrainer:
         if self.samples == 0:
             return
 
-        for optimizer in self.optimizers:
-            optimizer.step()
-        for scheduler in self.schedulers:
+        self.profiler.step()
+        with self.profiler.measure("optimizers", "step"):
+            self.step_optimizers()
+
+    def step_optimizers(self):
+        stepped = False
+        for optimizer, scheduler in zip(self.optimizers, self.schedulers):
+            if optimizer not in self.trained:
+                continue
+
+            # Gradients are accumulated over multiple ticks before stepping.
+            self.ticks[optimizer] += 1
+            accumulate = self.accumulate[optimizer]
+            if self.ticks[optimizer] % accumulate != 0:
+                continue
+
+            if self.world > 1:
+                self.all_reduce(optimizer, accumulate)
+            grads = [
+                p.grad
+                for group in optimizer.param_groups
+                for p in group["params"]
+                if p.grad is not None
+            ]
+
+            # The scaler can't step optimizers without gradients, e.g. from floats.
+            if len(grads) == 0:
+                continue
+            if self.world == 1 and accumulate > 1:
+                torch._foreach_div_(grads, accumulate)
+
+            self.scaler.step(optimizer)
             scheduler.step()
+            self.update_averages(self.averaged[optimizer], "ema")
+            stepped = True
+
+        if stepped:
+            self.scaler.update()
+
+    def update_averages(self, components, kind):
+        for cp in components:
+            average = self.averages.get(cp)
+            if average is None or average["kind"] != kind or cp in self.swapped:
+                continue
+
+            # Stochastic weight averages are the mean of weights at each epoch.
+            decay = average["decay"]
+            if kind == "swa":
+                decay = average["count"] / (average["count"] + 1)
+            with torch.no_grad():
+                torch._foreach_mul_(average["copies"], decay)
+                torch._foreach_add_(
+                    average["copies"], average["params"], alpha=1.0 - decay
+                )
+            average["count"] += 1
+
+    def average_epoch(self, components):
+        self.update_averages(components, "swa")
+
+    @contextlib.contextmanager
+    def swap_averages(self, components):
+        """Temporarily replace the weights of components by their averages, so they
+        can be evaluated without copying any parameters. Only the given components
+        are swapped, as others sharing the optimizer may still be training.
+        """
+        components = [cp for cp in components if cp in self.averages]
+        for cp in components:
+            self.swap(self.averages[cp])
+            self.swapped.add(cp)
+        try:
+            yield
+        finally:
+            for cp in components:
+                self.swap(self.averages[cp])
+                self.swapped.discard(cp)
+
+    def swap(self, average):
+        copies = average["copies"]
+        for i, param in enumerate(average["params"]):
+            param.data, copies[i] = copies[i], param.data
+
+    def all_reduce(self, optimizer, accumulate=1):
+        """Average the gradients of all workers, using one flattened buffer for all
+        the parameters of the optimizer.
+        """
+        params = [p for group in optimizer.param_groups for p in group["params"]]
+        grads = [torch.zeros_like(p) if p.grad is None else p.grad for p in params]
+
+        # Parameters without gradients on any worker keep none, as in single runs.
+        mask = [float(p.grad is not None) for p in params]
+        grads.append(torch.tensor(mask, dtype=grads[0].dtype, device=grads[0].device))
+
+        flat = _flatten_dense_tensors(grads)
+        dist.all_reduce(flat)
+        flat[: -len(mask)] /= self.world * accumulate
+        *tensors, mask = _unflatten_dense_tensors(flat, grads)
+
+        for param, grad, present in zip(params, tensors, mask.tolist()):
+            param.grad = grad if present > 0 else None
+
+    def synchronize(self, flag):
+        if self.world == 1:
+            return flag
+        value = torch.tensor([int(flag)])
+        dist.all_reduce(value, op=dist.ReduceOp.MAX)
+        return bool(value.item())
+
+    def state_dict(self, optimizer):
+        scheduler = self.schedulers[self.optimizers.index(optimizer)]
+        state = {"scaler": self.scaler.state_dict(), "ticks": self.ticks[optimizer]}
+        state["averages"] = [
+            {"count": self.averages[cp]["count"], "copies": self.averages[cp]["copies"]}
+            for cp in self.averaged[optimizer]
+        ]
+
+        # Shared optimizers have a layout depending on all groups, so aren't saved.
+        if not self.shared:
+            state["optimizer"] = optimizer.state_dict()
+            state["scheduler"] = scheduler.state_dict()
+        return state
+
+    def load_state_dict(self, optimizer, state):
+        scheduler = self.schedulers[self.optimizers.index(optimizer)]
+        if "optimizer" in state and not self.shared:
+            optimizer.load_state_dict(state["optimizer"])
+            scheduler.load_state_dict(state["scheduler"])
+        self.scaler.load_state_dict(state["scaler"])
+        self.ticks[optimizer] = state["ticks"]
+
+        for cp, saved in zip(self.averaged[optimizer], state.get("averages", [])):
+            self.averages[cp]["count"] = saved["count"]
+            with torch.no_grad():
+                for copy, value in zip(self.averages[cp]["copies"], saved["copies"]):
+                    copy.copy_(value)
+
+    def save(self, components, write=torch.save):
+        if self.rank > 0:
+            return
 
-    def save(self, components):
         log = []
         for instance in components:
             if not hasattr(instance, "parameters"):
@@ -132,7 +670,14 @@ class BasicTrainer:
             data = (cls.__module__ + "." + cls.__qualname__).encode("utf-8")
             digest = hashlib.blake2b(data, digest_size=8).hexdigest()
             filename = f"{cls.__name__}-{digest}.pkl"
-            torch.save(instance.state_dict(), f"models/{filename}")
+            write(instance.state_dict(), f"models/{filename}")
             log.append(cls.__qualname__)
 
+            # Averaged weights are saved alongside, e.g. `Model-0123abcd-ema.pkl`.
+            average = self.averages.get(instance)
+            if average is not None:
+                state = dict(instance.state_dict())
+                state.update(zip(average["names"], average["copies"]))
+                write(state, f"models/{filename[:-4]}-{average['kind']}.pkl")
+
         print("💾  Saved model snapshot for: {}.".format(", ".join(log)))
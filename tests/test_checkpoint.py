@@ -0,0 +1,20 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import pytest
+
+from pytrain.checkpoint import Checkpointer
+
+
+def test_checkpointer_keeps_most_recent(tmp_path):
+    checkpoints = Checkpointer(str(tmp_path), keep=2)
+    for epoch in range(4):
+        checkpoints.save("group", epoch, {"value": epoch})
+    checkpoints.wait()
+
+    assert len(checkpoints.history("group")) == 2
+    assert checkpoints.load("group")["epoch"] == 3
+
+
+def test_checkpointer_requires_keeping_one():
+    with pytest.raises(ValueError):
+        Checkpointer(keep=0)
@@ -0,0 +1,30 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import itertools
+
+from pytrain.data import Dataset, Stream
+
+
+def test_dataset_from_sharded_stream():
+    stream = Stream(shards=["a", "b"], reader=lambda s: iter([s + "0", s + "1"]))
+    dataset = Dataset.from_data(stream)
+    assert dataset.training is stream
+    assert dataset.validation is None
+
+    items = list(itertools.islice(dataset.training.items(), 4))
+    assert sorted(items) == ["a0", "a1", "b0", "b1"]
+
+
+def test_stream_shards_iterator_once_across_epochs():
+    for rank in range(2):
+        stream = Stream(source=iter(range(16)))
+        epochs = [list(itertools.islice(stream.items(rank, 2), 4)) for _ in range(2)]
+        assert epochs == [list(range(rank, 8, 2)), list(range(8 + rank, 16, 2))]
+
+
+def test_stream_shuffle_keeps_buffer_across_epochs():
+    stream = Stream(source=iter(range(20)), shuffle=4)
+    seen = []
+    for _ in range(4):
+        seen.extend(itertools.islice(stream.shuffled(stream.items()), 5))
+    assert sorted(seen) == list(range(20))
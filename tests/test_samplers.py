@@ -0,0 +1,46 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import torch
+import pytest
+
+from pytrain.samplers import get_sampler
+
+
+class Labelled:
+    def __init__(self, labels):
+        self.labels = torch.as_tensor(labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def test_ordered_repeats_indices_in_order():
+    batches = get_sampler("ordered")(torch.zeros(10), 4)
+    indices = torch.cat([next(batches) for _ in range(6)])
+    assert indices.tolist() == list(range(10)) * 2
+
+
+def test_shuffled_covers_every_index_once_per_epoch():
+    generator = torch.Generator().manual_seed(0)
+    batches = get_sampler("shuffled")(torch.zeros(100), 16, generator)
+    epochs = []
+    for _ in range(3):
+        indices = torch.cat([next(batches) for _ in range(7)])
+        assert sorted(indices.tolist()) == list(range(100))
+        epochs.append(indices.tolist())
+    assert epochs[0] != epochs[1]
+
+
+def test_stratified_keeps_class_proportions():
+    data = Labelled([0] * 80 + [1] * 20)
+    generator = torch.Generator().manual_seed(0)
+    batches = get_sampler("stratified")(data, 10, generator)
+    for _ in range(20):
+        batch = next(batches)
+        assert len(batch) == 10
+        assert 1 <= int((data.labels[batch] == 1).sum()) <= 3
+
+
+def test_stratified_requires_labels():
+    with pytest.raises(ValueError):
+        get_sampler("stratified")(torch.zeros(10), 4)
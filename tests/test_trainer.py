@@ -0,0 +1,76 @@
+# PyTrain — Copyright (c) 2019, Alex J. Champandard.
+
+import torch
+
+from pytrain.decorators import iterates, optimizes
+from pytrain.registry import Function
+from pytrain.trainer import BasicTrainer
+
+
+class Averaged(torch.nn.Linear):
+    pass
+
+
+optimizes(Averaged, ema=0.9)
+
+
+@iterates(batch_size=4)
+def task_regress(batch, model):
+    return torch.nn.functional.mse_loss(model(batch.data), batch.data)
+
+
+def test_ema_copies_do_not_require_grad():
+    model = Averaged(3, 3)
+    trainer = BasicTrainer("cpu")
+    optimizer = trainer.setup_components([model])
+    function = Function("task_regress", task_regress, None)
+    context = trainer.setup_function(
+        function, {"batch": torch.randn(16, 3), "model": model}, "training"
+    )
+
+    for _ in range(3):
+        trainer.prepare()
+        trainer.run_training(context)
+        trainer.step()
+
+    copies = trainer.averages[model]["copies"]
+    assert trainer.averages[model]["count"] == 3
+    assert not any(c.requires_grad for c in copies)
+
+    trainer.load_state_dict(optimizer, trainer.state_dict(optimizer))
+    assert not any(c.requires_grad for c in copies)
+
+
+def test_only_trained_optimizers_are_stepped():
+    model, other = torch.nn.Linear(3, 3), torch.nn.Linear(3, 3)
+    trainer = BasicTrainer("cpu")
+    first = trainer.setup_components([model])
+    second = trainer.setup_components([other])
+    function = Function("task_regress", task_regress, None)
+    context = trainer.setup_function(
+        function, {"batch": torch.randn(16, 3), "model": model}, "training"
+    )
+
+    for _ in range(3):
+        trainer.prepare()
+        trainer.run_training(context)
+        trainer.step()
+
+    assert trainer.ticks[first] == 3 and trainer.ticks[second] == 0
+    assert trainer.schedulers[1].last_epoch == 0
+
+
+def test_swap_averages_only_of_given_components():
+    first, second = Averaged(3, 3), Averaged(3, 3)
+    trainer = BasicTrainer("cpu", shared=True)
+    trainer.setup_components([first])
+    trainer.setup_components([second])
+    for average in trainer.averages.values():
+        for copy in average["copies"]:
+            copy.zero_()
+
+    weight = second.weight.detach().clone()
+    with trainer.swap_averages([first]):
+        assert first.weight.abs().sum() == 0
+        assert torch.equal(second.weight, weight)
+    assert first.weight.abs().sum() > 0